@@ -0,0 +1,73 @@
+from functools import wraps
+from hashlib import md5
+
+from django.core.cache import caches
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+RESPONSE_CACHE_ALIAS = 'responses'
+
+
+def normalize_query(params):
+    """Параметры запроса без учёта порядка параметров и их значений."""
+    return sorted((name, sorted(values)) for name, values in params.lists())
+
+
+def conditional(vary=('Accept',), cache_anonymous=False):
+    """Поддержка условных запросов (ETag, Last-Modified) в действии вьюсета.
+
+    Валидаторы берутся из метода вьюсета get_validators, который возвращает
+    пару (значения, от которых зависит ответ; время изменения или None)
+    или None, если валидаторы вычислить нельзя. Для неизменившегося ресурса
+    304 возвращается до запросов за данными и сериализации.
+
+    Если ответ зависит от пользователя, в vary нужно указать Authorization:
+    тогда ответы авторизованным пользователям помечаются как private.
+
+    С cache_anonymous данные ответов анонимам сохраняются в кэше responses
+    под ключом из ETag. Ключ меняется вместе с версиями данных, поэтому
+    устаревшие ответы не отдаются, а просто вытесняются по таймауту.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(view, request, *args, **kwargs):
+            validators = view.get_validators()
+            if validators is None:
+                return handler(view, request, *args, **kwargs)
+            parts, last_modified = validators
+            etag = quote_etag(md5('\n'.join(
+                map(str, (request.accepted_renderer.format, *parts))
+            ).encode()).hexdigest())
+            if last_modified is not None:
+                last_modified = int(last_modified.timestamp())
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified
+            )
+            cache_key = None
+            if cache_anonymous and not request.user.is_authenticated:
+                cache_key = f'response:{view.basename}:{view.action}:{etag}'
+            if response is None and cache_key is not None:
+                data = caches[RESPONSE_CACHE_ALIAS].get(cache_key)
+                if data is not None:
+                    response = Response(data)
+                    response['X-Cache'] = 'HIT'
+            if response is None:
+                response = handler(view, request, *args, **kwargs)
+                if cache_key is not None and response.status_code == 200:
+                    caches[RESPONSE_CACHE_ALIAS].set(cache_key, response.data)
+                    response['X-Cache'] = 'MISS'
+            if response.status_code in (200, 304):
+                response['ETag'] = etag
+                if last_modified is not None:
+                    response['Last-Modified'] = http_date(last_modified)
+                private = (
+                    'Authorization' in vary and request.user.is_authenticated
+                )
+                response['Cache-Control'] = (
+                    'private, no-cache' if private else 'no-cache'
+                )
+            patch_vary_headers(response, vary)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,160 @@
+import csv
+from tempfile import SpooledTemporaryFile
+from urllib.parse import quote
+
+from django.core.cache import cache
+from django.db.models import Max
+from django.db.models.functions import Length
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+from openpyxl.utils import get_column_letter
+
+HEADERS = ('Ингредиент', 'Ед. изм.', 'Количество')
+CHUNK_SIZE = 64 * 1024
+
+
+class BaseExporter:
+    """Базовый класс выгрузки списка покупок.
+
+    Принимает queryset кортежей (название, единица измерения, количество)
+    и при итерации отдаёт содержимое файла частями в байтах. Строки
+    читаются из базы через iterator() и в памяти не накапливаются.
+    """
+
+    extension = None
+    content_type = None
+
+    def __init__(self, ingredients):
+        self.ingredients = ingredients
+
+    def __iter__(self):
+        raise NotImplementedError
+
+    def get_filename(self, username):
+        return f'shopping_list_{username}.{self.extension}'
+
+    def get_content_disposition(self, username):
+        """Заголовок Content-Disposition с учётом не-ASCII имён файлов."""
+        filename = self.get_filename(username)
+        try:
+            filename.encode('ascii')
+            file_expr = f'filename="{filename}"'
+        except UnicodeEncodeError:
+            file_expr = f"filename*=utf-8''{quote(filename)}"
+        return f'attachment; {file_expr}'
+
+
+class TxtExporter(BaseExporter):
+    """Выгрузка списка покупок в текстовый файл."""
+
+    extension = 'txt'
+    content_type = 'text/plain; charset=utf-8'
+
+    def __iter__(self):
+        yield 'Список покупок:\n'.encode()
+        for name, measurement_unit, amount in self.ingredients.iterator():
+            yield f'- {name} ({measurement_unit}) — {amount}\n'.encode()
+
+
+class _Echo:
+    """Псевдофайл, возвращающий записанную строку вместо её сохранения."""
+
+    def write(self, value):
+        return value
+
+
+class CsvExporter(BaseExporter):
+    """Выгрузка списка покупок в CSV-файл."""
+
+    extension = 'csv'
+    content_type = 'text/csv; charset=utf-8'
+
+    def __iter__(self):
+        writer = csv.writer(_Echo())
+        # BOM нужен, чтобы Excel распознал кодировку файла.
+        yield ('\ufeff' + writer.writerow(HEADERS)).encode()
+        for row in self.ingredients.iterator():
+            yield writer.writerow(row).encode()
+
+
+class XlsxExporter(BaseExporter):
+    """Выгрузка списка покупок в xlsx-файл.
+
+    Книга создаётся в режиме write-only: строки сразу сбрасываются во
+    временный файл, а не хранятся в памяти в виде ячеек. Ширина столбцов
+    в формате xlsx записывается перед строками, поэтому она считается
+    отдельными запросами к базе. Архив xlsx собирается только после
+    записи всех строк, так что отдаётся он после формирования, но память
+    не зависит от длины списка.
+    """
+
+    extension = 'xlsx'
+    content_type = (
+        'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    )
+
+    def get_widths(self):
+        """Ширина столбцов по самым длинным значениям списка."""
+        lengths = self.ingredients.aggregate(
+            name=Max(Length('ingredient__name')),
+            measurement_unit=Max(Length('ingredient__measurement_unit')),
+        )
+        max_amount = self.ingredients.order_by('-amount').values_list(
+            'amount', flat=True
+        ).first()
+        lengths = (
+            lengths['name'] or 0,
+            lengths['measurement_unit'] or 0,
+            len(str(max_amount or '')),
+        )
+        return [
+            max(len(header), length)
+            for header, length in zip(HEADERS, lengths)
+        ]
+
+    def __iter__(self):
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet('Список покупок')
+        for index, width in enumerate(self.get_widths(), 1):
+            ws.column_dimensions[get_column_letter(index)].width = width + 2
+        header = []
+        for value in HEADERS:
+            cell = WriteOnlyCell(ws, value=value)
+            cell.font = Font(bold=True)
+            header.append(cell)
+        ws.append(header)
+        for row in self.ingredients.iterator():
+            ws.append(row)
+
+        with SpooledTemporaryFile(max_size=CHUNK_SIZE) as buffer:
+            wb.save(buffer)
+            buffer.seek(0)
+            while chunk := buffer.read(CHUNK_SIZE):
+                yield chunk
+
+
+def cache_content(chunks, key, timeout, max_size):
+    """Отдаёт части файла, параллельно сохраняя файл целиком в кэш.
+
+    Файлы больше max_size байт в кэш не попадают.
+    """
+    parts = []
+    size = 0
+    for chunk in chunks:
+        if parts is not None:
+            size += len(chunk)
+            if size <= max_size:
+                parts.append(chunk)
+            else:
+                parts = None
+        yield chunk
+    if parts is not None:
+        cache.set(key, b''.join(parts), timeout)
+
+
+EXPORTERS = {
+    exporter.extension: exporter
+    for exporter in (XlsxExporter, CsvExporter, TxtExporter)
+}
+DEFAULT_FORMAT = XlsxExporter.extension
@@ -0,0 +1,113 @@
+import filetype
+from django.core.files.uploadedfile import UploadedFile
+from drf_extra_fields.fields import Base64FileField, Base64ImageField
+from rest_framework import serializers
+
+from api.uploads import HEADER_SIZE
+from recipes.images import renditions_field
+
+
+def resolve_pks(catalogue, queryset, pks):
+    """Объекты по списку первичных ключей с сохранением порядка.
+
+    Объекты берутся из справочника в памяти, а отсутствующие в нём (снимок
+    мог ещё не обновиться) - из базы одним запросом id__in. Возвращает пару
+    (объекты, список несуществующих ключей).
+    """
+    objects = {}
+    for pk in pks:
+        obj = catalogue.get(pk)
+        if obj is not None:
+            objects[pk] = obj
+    missing = [pk for pk in pks if pk not in objects]
+    if missing:
+        objects.update(queryset.in_bulk(missing))
+        missing = [pk for pk in dict.fromkeys(missing) if pk not in objects]
+    if missing:
+        return None, missing
+    return [objects[pk] for pk in pks], []
+
+
+class CatalogueRelatedListField(serializers.ListField):
+    """Список первичных ключей, проверяемый по справочнику целиком.
+
+    Обо всех несуществующих ключах сообщается одной ошибкой.
+    """
+
+    child = serializers.IntegerField()
+    default_error_messages = {
+        'does_not_exist': 'Объекты с id {pk_list} не существуют.',
+    }
+
+    def __init__(self, catalogue, queryset, **kwargs):
+        self.catalogue = catalogue
+        self.queryset = queryset
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        objects, missing = resolve_pks(
+            self.catalogue, self.queryset, super().to_internal_value(data)
+        )
+        if missing:
+            self.fail(
+                'does_not_exist', pk_list=', '.join(map(str, missing))
+            )
+        return objects
+
+    def to_representation(self, data):
+        return [obj.pk for obj in data.all()]
+
+
+class RawBase64ImageField(Base64FileField):
+    """Изображение в base64 или файлом, сохраняемое без декодирования Pillow.
+
+    В запросе формат определяется только по сигнатуре файла, а полная
+    проверка и пересохранение выполняются в фоне (recipes.images). Файлы
+    из multipart или тела запроса уже проверены ImageUploadHandler и
+    лежат во временном файле, откуда при сохранении перемещаются.
+    """
+
+    ALLOWED_TYPES = Base64ImageField.ALLOWED_TYPES
+    INVALID_FILE_MESSAGE = Base64ImageField.INVALID_FILE_MESSAGE
+    INVALID_TYPE_MESSAGE = Base64ImageField.INVALID_TYPE_MESSAGE
+
+    def to_internal_value(self, data):
+        if not isinstance(data, UploadedFile):
+            return super().to_internal_value(data)
+        if hasattr(data, 'image_extension'):
+            extension = data.image_extension
+        else:
+            extension = filetype.guess_extension(data.read(HEADER_SIZE))
+            data.seek(0)
+        if extension not in self.ALLOWED_TYPES:
+            raise serializers.ValidationError(self.INVALID_TYPE_MESSAGE)
+        data.name = f'{self.get_file_name(None)}.{extension}'
+        return serializers.FileField.to_internal_value(self, data)
+
+    def get_file_extension(self, filename, decoded_file):
+        return filetype.guess_extension(decoded_file)
+
+
+class RenditionImageField(serializers.ImageField):
+    """Ссылка на вариант изображения из контекста сериализатора.
+
+    Имя варианта берётся из context['image_rendition'], а если его нет -
+    из rendition поля. Пока вариант не готов, отдаётся исходное изображение.
+    """
+
+    def __init__(self, rendition=None, **kwargs):
+        self.rendition = rendition
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        rendition = self.context.get('image_rendition', self.rendition)
+        path = None
+        if value and rendition:
+            path = getattr(
+                value.instance, renditions_field(value.field.name), {}
+            ).get(rendition)
+        if path is None:
+            return super().to_representation(value)
+        url = value.storage.url(path)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
@@ -1,6 +1,6 @@
 from django_filters import rest_framework as filters
 
-from recipes.models import Ingredient, Recipe, Tag
+from recipes.models import Recipe, Tag
 
 
 class RecipeFilter(filters.FilterSet):
@@ -44,13 +44,3 @@ class RecipeFilter(filters.FilterSet):
         if value:
             return queryset.none()
         return queryset
-
-
-class IngredientFilter(filters.FilterSet):
-    """Фильтр для ингредиентов."""
-
-    name = filters.CharFilter(lookup_expr='istartswith')
-
-    class Meta:
-        model = Ingredient
-        fields = ('name',)
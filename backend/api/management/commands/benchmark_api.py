@@ -0,0 +1,512 @@
+import json
+import platform
+import subprocess
+import sys
+from base64 import b64encode
+from io import BytesIO
+from itertools import combinations
+from math import ceil
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+import django
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.conditional import RESPONSE_CACHE_ALIAS
+from api.exporters import EXPORTERS
+from api.filters import RecipeFilter
+from api.serializers import FRAGMENT_CACHE_ALIAS
+from recipes.cache import VERSIONS_CACHE_ALIAS, bump_shopping_cart_versions
+from recipes.catalogue import ingredient_catalogue, tag_catalogue
+from recipes.counters import reconcile_counters
+from recipes.models import Ingredient, Recipe, ShoppingCart, Tag, User
+
+PREFIX = 'bench'
+CART_SIZES = (1, 10, 100, 500)
+INGREDIENT_COUNTS = (1, 10, 40)
+CACHE_MODES = ('cold', 'warm')
+BENCHMARK_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmark',
+    },
+    RESPONSE_CACHE_ALIAS: {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmark-responses',
+    },
+    VERSIONS_CACHE_ALIAS: {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmark-versions',
+    },
+    FRAGMENT_CACHE_ALIAS: {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmark-fragments',
+    },
+}
+
+
+def percentile(values, percent):
+    """Процентиль методом ближайшего ранга."""
+    ordered = sorted(values)
+    return ordered[max(ceil(len(ordered) * percent / 100) - 1, 0)]
+
+
+def make_image():
+    """Картинка рецепта в base64, как её отправляет фронтенд."""
+    buffer = BytesIO()
+    Image.new('RGB', (600, 400), '#e0a96d').save(buffer, 'PNG')
+    return 'data:image/png;base64,' + b64encode(buffer.getvalue()).decode()
+
+
+def summarize(latencies, query_counts, query_times, statuses):
+    return {
+        'requests': len(latencies),
+        'statuses': sorted(set(statuses)),
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50), 3),
+            'p95': round(percentile(latencies, 95), 3),
+            'max': round(max(latencies), 3),
+            'mean': round(sum(latencies) / len(latencies), 3),
+        },
+        'queries': {
+            'mean': round(sum(query_counts) / len(query_counts), 2),
+            'max': max(query_counts),
+        },
+        'sql_ms': {
+            'p50': round(percentile(query_times, 50), 3),
+            'p95': round(percentile(query_times, 95), 3),
+            'mean': round(sum(query_times) / len(query_times), 3),
+        },
+    }
+
+
+class QueryTimer:
+    """Обёртка выполнения SQL, считающая запросы и их суммарное время.
+
+    В отличие от connection.queries время не округляется до миллисекунд.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started_at = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += perf_counter() - started_at
+            self.count += 1
+
+
+def get_revision():
+    try:
+        return subprocess.run(
+            ('git', 'rev-parse', '--short', 'HEAD'),
+            capture_output=True,
+            check=True,
+            cwd=settings.BASE_DIR,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    """Замер задержек и количества SQL-запросов эндпоинтов API."""
+
+    help = (
+        'Создаёт тестовую базу, наполняет её generate_fixtures и прогоняет '
+        'запросы к API через тестовый клиент Django. Для каждого сценария '
+        'выводит в JSON p50/p95 задержки, количество и время SQL-запросов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--carts-per-user', type=int, default=5)
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=20,
+            help='Количество замеряемых запросов на сценарий.',
+        )
+        parser.add_argument(
+            '--warmup',
+            type=int,
+            default=1,
+            help=(
+                'Сколько раз запросить каждый URL сценария перед замером '
+                'в режиме warm.'
+            ),
+        )
+        parser.add_argument(
+            '--cache',
+            nargs='+',
+            choices=CACHE_MODES,
+            default=list(CACHE_MODES),
+            help=(
+                'Режимы замера: cold - кэши очищаются перед каждым запросом, '
+                'warm - после прогрева. Результаты сценария выводятся под '
+                'именами <сценарий>:cold и <сценарий>:warm.'
+            ),
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--only',
+            help='Запускать только сценарии, имя которых содержит строку.',
+        )
+        parser.add_argument(
+            '--output',
+            help='Файл для результатов, по умолчанию stdout.',
+        )
+        parser.add_argument(
+            '--baseline',
+            help='JSON предыдущего запуска для сравнения p95 и запросов.',
+        )
+        parser.add_argument(
+            '--keepdb',
+            action='store_true',
+            help='Не удалять тестовую базу и переиспользовать её данные.',
+        )
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations должен быть положительным.')
+        self.options = options
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, keepdb=options['keepdb']
+        )
+        try:
+            with TemporaryDirectory() as media_root, override_settings(
+                CACHES=BENCHMARK_CACHES,
+                MEDIA_ROOT=media_root,
+                DEBUG=False,
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+            ):
+                self.prepare_data()
+                report = {
+                    'revision': get_revision(),
+                    'database': connection.vendor,
+                    'python': platform.python_version(),
+                    'django': django.get_version(),
+                    'dataset': {
+                        'users': User.objects.count(),
+                        'recipes': Recipe.objects.count(),
+                        'ingredients': Ingredient.objects.count(),
+                    },
+                    'iterations': options['iterations'],
+                    'scenarios': self.run_scenarios(),
+                }
+        finally:
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=options['keepdb']
+            )
+
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output)
+        else:
+            self.stdout.write(output)
+        if options['baseline']:
+            self.compare(report, options['baseline'])
+
+    def prepare_data(self):
+        if User.objects.filter(username__startswith=f'{PREFIX}_').exists():
+            return
+        if not Ingredient.objects.exists():
+            call_command('import_from_csv', verbosity=0, stdout=sys.stderr)
+        call_command(
+            'generate_fixtures',
+            users=self.options['users'],
+            recipes=self.options['recipes'],
+            ingredients_per_recipe=self.options['ingredients_per_recipe'],
+            carts_per_user=self.options['carts_per_user'],
+            seed=self.options['seed'],
+            prefix=PREFIX,
+            stdout=sys.stderr,
+        )
+
+    def get_cart_users(self):
+        """Пользователи со списками покупок из CART_SIZES рецептов.
+
+        Размер списка ограничен количеством рецептов в базе.
+        """
+        recipe_ids = list(
+            Recipe.objects.order_by('id').values_list('id', flat=True)[
+                :max(CART_SIZES)
+            ]
+        )
+        users = {}
+        created_ids = []
+        sizes = {min(size, len(recipe_ids)) for size in CART_SIZES} - {0}
+        for size in sorted(sizes):
+            user, created = User.objects.get_or_create(
+                username=f'{PREFIX}_cart_{size}',
+                defaults={
+                    'email': f'{PREFIX}_cart_{size}@example.com',
+                    'first_name': 'Покупатель',
+                    'last_name': str(size),
+                },
+            )
+            if created:
+                ShoppingCart.objects.bulk_create(
+                    ShoppingCart(user=user, recipe_id=recipe_id)
+                    for recipe_id in recipe_ids[:size]
+                )
+                created_ids.append(user.id)
+            users[size] = user
+        if created_ids:
+            # bulk_create не отправляет сигналы, обновляющие счётчики.
+            reconcile_counters()
+            bump_shopping_cart_versions(created_ids)
+        return users
+
+    def get_write_scenarios(self, user, recipe):
+        """Создание и изменение рецепта с разным числом ингредиентов.
+
+        PATCH по очереди передаёт два непересекающихся набора ингредиентов,
+        поэтому каждый запрос меняет состав рецепта.
+        """
+        ingredient_ids = list(
+            Ingredient.objects.order_by('id').values_list('id', flat=True)[
+                :2 * max(INGREDIENT_COUNTS)
+            ]
+        )
+        tag_id = Tag.objects.order_by('id').values_list(
+            'id', flat=True
+        ).first()
+        image = make_image()
+
+        def get_data(ids):
+            return {
+                'name': f'{PREFIX} рецепт',
+                'text': 'Описание рецепта.',
+                'cooking_time': 10,
+                'tags': [tag_id],
+                'ingredients': [{'id': pk, 'amount': 10} for pk in ids],
+            }
+
+        scenarios = []
+        for count in INGREDIENT_COUNTS:
+            if 2 * count > len(ingredient_ids):
+                break
+            first = ingredient_ids[:count]
+            second = ingredient_ids[count:2 * count]
+            scenarios += [
+                (
+                    f'recipes:create:ingredients_{count}',
+                    [('post', '/api/recipes/', {
+                        **get_data(first), 'image': image
+                    })],
+                    user,
+                ),
+                (
+                    f'recipes:update:ingredients_{count}',
+                    [
+                        ('patch', f'/api/recipes/{recipe.pk}/', get_data(ids))
+                        for ids in (first, second)
+                    ],
+                    recipe.author,
+                ),
+            ]
+        return scenarios
+
+    def get_scenarios(self):
+        """Сценарии (имя, запросы, пользователь).
+
+        Запросы выполняются по кругу: URL для GET или кортежи (метод, URL,
+        данные). Пользователь None - аноним.
+        """
+        user = User.objects.filter(
+            username__startswith=f'{PREFIX}_'
+        ).order_by('id').first()
+        recipe_ids = list(
+            Recipe.objects.order_by('-pub_date', '-id').values_list(
+                'id', flat=True
+            )[:self.options['iterations']]
+        )
+        values = {
+            'author': Recipe.objects.filter(
+                pk=recipe_ids[0]
+            ).values_list('author_id', flat=True).get(),
+            'is_favorited': 1,
+            'is_in_shopping_cart': 1,
+            'tags': Tag.objects.order_by('id').values_list(
+                'slug', flat=True
+            ).first(),
+        }
+        names = Ingredient.objects.order_by('id').values_list(
+            'name', flat=True
+        )[:self.options['iterations']]
+
+        scenarios = [
+            ('recipes:list:anonymous', ['/api/recipes/'], None),
+            ('recipes:list:cursor', ['/api/recipes/?paginate=cursor'], user),
+        ]
+        filter_names = tuple(RecipeFilter.base_filters)
+        for size in range(len(filter_names) + 1):
+            for combination in combinations(filter_names, size):
+                query = '&'.join(
+                    f'{name}={values[name]}' for name in combination
+                )
+                scenarios.append((
+                    'recipes:list:' + ('+'.join(combination) or 'all'),
+                    [f'/api/recipes/?{query}'],
+                    user,
+                ))
+        scenarios += [
+            (
+                'recipes:detail',
+                [f'/api/recipes/{pk}/' for pk in recipe_ids],
+                user,
+            ),
+            (
+                'users:subscriptions',
+                ['/api/users/subscriptions/?recipes_limit=3'],
+                user,
+            ),
+            (
+                'ingredients:search',
+                [f'/api/ingredients/?name={name[:3]}' for name in names],
+                user,
+            ),
+        ]
+        scenarios += [
+            (
+                f'recipes:download_shopping_cart:{file_format}',
+                [
+                    '/api/recipes/download_shopping_cart/'
+                    f'?format={file_format}'
+                ],
+                user,
+            )
+            for file_format in EXPORTERS
+        ]
+        # Сборка списка покупок в зависимости от его размера.
+        scenarios += [
+            (
+                f'recipes:download_shopping_cart:{file_format}:cart_{size}',
+                [
+                    '/api/recipes/download_shopping_cart/'
+                    f'?format={file_format}'
+                ],
+                cart_user,
+            )
+            for size, cart_user in self.get_cart_users().items()
+            for file_format in EXPORTERS
+        ]
+        # Запросы на запись меняют данные, поэтому выполняются последними.
+        scenarios += self.get_write_scenarios(
+            user, Recipe.objects.get(pk=recipe_ids[0])
+        )
+        return scenarios
+
+    @staticmethod
+    def get_client(user):
+        client = APIClient()
+        if user is not None:
+            token = Token.objects.get_or_create(user=user)[0]
+            client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        return client
+
+    def run_scenarios(self):
+        clients = {}
+        results = {}
+        for scenario, requests, user in self.get_scenarios():
+            if self.options['only'] and self.options['only'] not in scenario:
+                continue
+            key = None if user is None else user.pk
+            if key not in clients:
+                clients[key] = self.get_client(user)
+            for mode in self.options['cache']:
+                name = f'{scenario}:{mode}'
+                results[name] = self.run_scenario(
+                    clients[key], requests, cold=mode == 'cold'
+                )
+                self.stderr.write(
+                    f'{name}: p95 {results[name]["latency_ms"]["p95"]} мс, '
+                    f'запросов {results[name]["queries"]["max"]}, '
+                    f'статусы {results[name]["statuses"]}'
+                )
+        return results
+
+    @staticmethod
+    def clear_caches():
+        """Очистка кэшей.
+
+        Справочники в памяти процесса сразу загружаются заново, чтобы их
+        запросы не попадали в замер.
+        """
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        tag_catalogue.refresh()
+        ingredient_catalogue.refresh()
+
+    def run_scenario(self, client, requests, cold=False):
+        """Замер сценария.
+
+        С cold кэши очищаются перед каждым запросом, иначе сначала каждый
+        запрос сценария выполняется warmup раз.
+        """
+        for _ in range(0 if cold else self.options['warmup']):
+            for request in requests:
+                self.request(client, request)
+        latencies = []
+        query_counts = []
+        query_times = []
+        statuses = []
+        for index in range(self.options['iterations']):
+            if cold:
+                self.clear_caches()
+            timer = QueryTimer()
+            with connection.execute_wrapper(timer):
+                started_at = perf_counter()
+                status = self.request(
+                    client, requests[index % len(requests)]
+                )
+                latencies.append((perf_counter() - started_at) * 1000)
+            query_counts.append(timer.count)
+            query_times.append(timer.seconds * 1000)
+            statuses.append(status)
+        return summarize(latencies, query_counts, query_times, statuses)
+
+    @staticmethod
+    def request(client, request):
+        if isinstance(request, str):
+            response = client.get(request)
+        else:
+            method, url, data = request
+            response = getattr(client, method)(url, data, format='json')
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        return response.status_code
+
+    def compare(self, report, path):
+        try:
+            with open(path, encoding='utf-8') as file:
+                baseline = json.load(file)['scenarios']
+        except (OSError, ValueError, KeyError) as error:
+            raise CommandError(f'Не удалось прочитать {path}: {error}')
+        for name, result in report['scenarios'].items():
+            if name not in baseline:
+                continue
+            old_p95 = baseline[name]['latency_ms']['p95']
+            new_p95 = result['latency_ms']['p95']
+            change = (new_p95 - old_p95) / old_p95 * 100 if old_p95 else 0
+            self.stderr.write(
+                f'{name}: p95 {old_p95} -> {new_p95} мс ({change:+.0f}%), '
+                f'запросов {baseline[name]["queries"]["max"]} -> '
+                f'{result["queries"]["max"]}'
+            )
@@ -0,0 +1,12 @@
+from rest_framework.negotiation import DefaultContentNegotiation
+
+
+class IgnoreFormatContentNegotiation(DefaultContentNegotiation):
+    """Выбор рендерера без учёта параметра format.
+
+    Используется там, где параметр format задаёт формат выгружаемого файла,
+    а не рендерер ответа.
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
@@ -1,10 +1,223 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from functools import partial
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (
+    BasePagination, PageNumberPagination, _positive_int
+)
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 from recipes.constants import PAGINATOR_SIZE
 
 
+class KeysetPaginator(BasePagination):
+    """Пагинатор по ключу (курсору) без COUNT(*) и OFFSET.
+
+    Страница выбирается условием по полям ordering представления
+    (cursor_ordering), значения которых для крайней записи страницы
+    передаются в параметре cursor. Последнее поле должно быть уникальным.
+    """
+
+    page_size = PAGINATOR_SIZE
+    page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def __init__(self, ordering):
+        self.ordering = ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+        values, reverse = self.decode_cursor(request)
+
+        ordering = self.ordering
+        if reverse:
+            ordering = tuple(self.invert(field) for field in ordering)
+        queryset = queryset.order_by(*ordering)
+        if values is not None:
+            # Значения курсора приходят от клиента и проверяются полями
+            # модели при построении условия.
+            try:
+                queryset = queryset.filter(self.get_position_filter(
+                    ordering, values
+                ))
+            except (ValidationError, TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+        results = list(queryset[:page_size + 1])
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if reverse:
+            results.reverse()
+
+        if reverse:
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, values is not None
+        self.next_values = self.previous_values = None
+        if results and has_next:
+            self.next_values = self.get_values(results[-1])
+        if results and has_previous:
+            self.previous_values = self.get_values(results[0])
+        return results
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', None),
+            ('next', self.get_link(self.next_values, reverse=False)),
+            ('previous', self.get_link(self.previous_values, reverse=True)),
+            ('results', data),
+        ]))
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    @staticmethod
+    def invert(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    @staticmethod
+    def get_position_filter(ordering, values):
+        """Условие «запись идёт после values» для составного ключа."""
+        position = Q()
+        equal = Q()
+        for field, value in zip(ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            position |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return position
+
+    def get_values(self, obj):
+        return [getattr(obj, field.lstrip('-')) for field in self.ordering]
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            values, reverse = cursor['v'], bool(cursor['r'])
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    def get_link(self, values, reverse):
+        if values is None:
+            return None
+        # str() сохраняет микросекунды дат, в отличие от DjangoJSONEncoder.
+        cursor = json.dumps({'v': values, 'r': int(reverse)}, default=str)
+        return replace_query_param(
+            self.base_url,
+            self.cursor_query_param,
+            urlsafe_b64encode(cursor.encode()).decode('ascii'),
+        )
+
+
+class CountedPaginator(Paginator):
+    """Paginator Django, получающий количество объектов от count_func."""
+
+    def __init__(self, *args, count_func, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.count_func = count_func
+
+    @cached_property
+    def count(self):
+        return self.count_func()
+
+
+def estimate_count(queryset):
+    """Оценка количества строк таблицы по статистике PostgreSQL.
+
+    Возвращает None для запросов с фильтрами, для других СУБД и для таблиц
+    меньше COUNT_ESTIMATE_THRESHOLD строк, где точный подсчёт дёшев.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql' or queryset.query.has_filters():
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+            (queryset.model._meta.db_table,),
+        )
+        row = cursor.fetchone()
+    if row is None or row[0] < settings.COUNT_ESTIMATE_THRESHOLD:
+        return None
+    return int(row[0])
+
+
 class BasePaginator(PageNumberPagination):
-    """Пагинатор для пользователей и рецептов."""
+    """Пагинатор для пользователей и рецептов.
+
+    По умолчанию постраничный. С параметром paginate=cursor переключается
+    на KeysetPaginator по полям cursor_ordering представления.
+
+    Если у представления есть метод get_count_cache_key, общее количество
+    объектов кэшируется по возвращаемому им ключу фильтров.
+    """
 
     page_size_query_param = 'limit'
     page_size = PAGINATOR_SIZE
+    mode_query_param = 'paginate'
+    cursor_mode = 'cursor'
+
+    keyset_paginator = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        ordering = getattr(view, 'cursor_ordering', None)
+        if (
+            ordering
+            and request.query_params.get(self.mode_query_param)
+            == self.cursor_mode
+        ):
+            self.keyset_paginator = KeysetPaginator(ordering)
+            return self.keyset_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        self.django_paginator_class = partial(
+            CountedPaginator,
+            count_func=partial(self.get_count, queryset, view),
+        )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_count(self, queryset, view):
+        get_count_cache_key = getattr(view, 'get_count_cache_key', None)
+        signature = get_count_cache_key() if get_count_cache_key else None
+        if signature is None:
+            return queryset.count()
+        key = 'count:{}:{}'.format(
+            view.__class__.__name__,
+            md5(json.dumps(signature).encode()).hexdigest(),
+        )
+        count = cache.get(key)
+        if count is None:
+            count = estimate_count(queryset)
+            if count is None:
+                count = queryset.count()
+            cache.set(key, count, settings.COUNT_CACHE_TIMEOUT)
+        return count
+
+    def get_paginated_response(self, data):
+        if self.keyset_paginator is not None:
+            return self.keyset_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,82 @@
+import json
+
+from django.core.files.uploadhandler import StopUpload
+from rest_framework.exceptions import ParseError, ValidationError
+from rest_framework.parsers import (
+    DataAndFiles, FileUploadParser, MultiPartParser
+)
+
+from api.uploads import ImageUploadHandler
+
+JSON_PART = 'data'
+
+
+def use_image_upload_handler(request):
+    """Замена обработчиков загрузки запроса на потоковый ImageUploadHandler.
+
+    Должна вызываться до первого обращения к телу запроса. Возвращает
+    установленный обработчик.
+    """
+    django_request = request._request
+    handler = ImageUploadHandler(django_request)
+    django_request.upload_handlers = [handler]
+    return handler
+
+
+def raise_upload_errors(errors):
+    """Ошибки ImageUploadHandler как ошибки валидации полей запроса."""
+    if errors:
+        raise ValidationError({
+            field_name: [message] for field_name, message in errors.items()
+        })
+
+
+class ImageMultiPartParser(MultiPartParser):
+    """multipart/form-data с потоковой загрузкой изображений на диск.
+
+    Поля, которые не передать формой (списки ингредиентов и тегов), можно
+    отправить JSON-объектом в части data, а файлы - отдельными частями.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        handler = use_image_upload_handler(parser_context['request'])
+        result = super().parse(stream, media_type, parser_context)
+        raise_upload_errors(handler.errors)
+        if JSON_PART not in result.data:
+            return result
+        try:
+            data = json.loads(result.data[JSON_PART])
+        except ValueError as error:
+            raise ParseError(f'Часть {JSON_PART} не является JSON: {error}')
+        if not isinstance(data, dict):
+            raise ParseError(f'Часть {JSON_PART} должна быть JSON-объектом.')
+        return DataAndFiles(data, result.files.dict())
+
+
+class RawImageParser(FileUploadParser):
+    """Изображение в теле запроса целиком, например Content-Type: image/png.
+
+    Файл передаётся в поле upload_field вьюсета, имя файла не обязательно.
+    """
+
+    media_type = 'image/*'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        handler = use_image_upload_handler(parser_context['request'])
+        field_name = parser_context['view'].upload_field
+        try:
+            result = super().parse(stream, media_type, parser_context)
+        except (StopUpload, ParseError):
+            # FileUploadParser не ловит StopUpload, а отклонённый
+            # обработчиком файл считает ошибкой разбора.
+            if not handler.errors:
+                raise
+        raise_upload_errors({
+            field_name: message for message in handler.errors.values()
+        })
+        return DataAndFiles({}, {field_name: result.files['file']})
+
+    def get_filename(self, stream, media_type, parser_context):
+        return super().get_filename(stream, media_type, parser_context) or (
+            'image'
+        )
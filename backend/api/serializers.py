@@ -1,17 +1,35 @@
+from hashlib import md5
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
 from django.core.validators import MinValueValidator
-from drf_extra_fields.fields import Base64ImageField
+from django.db import transaction
+from django.db.models import Manager, Prefetch, prefetch_related_objects
 from rest_framework import serializers
 
+from api.fields import (
+    CatalogueRelatedListField, RawBase64ImageField, RenditionImageField,
+    resolve_pks
+)
+from recipes.cache import (
+    USERS_VERSION_KEY, get_version, invalidate_recipe_shopping_carts
+)
+from recipes.catalogue import ingredient_catalogue, tag_catalogue
+from recipes.images import clear_renditions, enqueue_image
 from recipes.models import (
     Ingredient, Recipe, RecipeIngredient, Tag, User, Favorite, ShoppingCart
 )
 from users.models import Subscription
 
+FRAGMENT_CACHE_ALIAS = 'fragments'
+
 
 class UserViewSerializer(serializers.ModelSerializer):
     """Сериализатор для получения данных о пользователе."""
 
     is_subscribed = serializers.SerializerMethodField()
+    avatar = RenditionImageField(required=False, allow_null=True)
 
     class Meta:
         model = User
@@ -27,6 +45,8 @@ class UserViewSerializer(serializers.ModelSerializer):
 
     def get_is_subscribed(self, obj):
         """Проверка подписки на просматриваемый профиль."""
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
         return bool(request
                     and request.user.is_authenticated
@@ -38,19 +58,29 @@ class UserViewSerializer(serializers.ModelSerializer):
 class AvatarSerializer(UserViewSerializer):
     """Сериализатор для добавления и удаления аватара."""
 
-    avatar = Base64ImageField(required=True)
+    avatar = RawBase64ImageField(required=True)
 
     class Meta(UserViewSerializer.Meta):
         fields = ('avatar',)
 
+    def update(self, instance, validated_data):
+        with transaction.atomic():
+            clear_renditions(instance, 'avatar')
+            instance = super().update(instance, validated_data)
+            enqueue_image(instance, 'avatar')
+        return instance
+
 
 class RecipeShortSerializer(serializers.ModelSerializer):
     """Сериализатор для отображения краткой информации о рецепте.
 
     Будет использоваться при получении списка подписок пользователя, где по
     каждому пользователю будет возвращаться список их рецептов в коротком виде.
+    Вместо исходного изображения отдаётся миниатюра.
     """
 
+    image = RenditionImageField(rendition='thumbnail', read_only=True)
+
     class Meta:
         model = Recipe
         fields = (
@@ -65,7 +95,6 @@ class SubscriptionSerializer(UserViewSerializer):
     """Сериализатор для списка подписок пользователя."""
 
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
 
     class Meta(UserViewSerializer.Meta):
         fields = UserViewSerializer.Meta.fields + (
@@ -73,22 +102,38 @@ class SubscriptionSerializer(UserViewSerializer):
             'recipes_count',
         )
 
+    @staticmethod
+    def prefetch_recipes(queryset, request):
+        """Подгрузка превью рецептов для всех авторов одним запросом."""
+        try:
+            recipes_limit = int(request.query_params['recipes_limit'])
+        except (KeyError, TypeError, ValueError):
+            recipes_limit = None
+        if recipes_limit is not None and recipes_limit < 0:
+            recipes_limit = None
+        return queryset.prefetch_related(Prefetch(
+            'recipes',
+            queryset=Recipe.objects.previews(recipes_limit),
+            to_attr='recipes_preview',
+        ))
+
     def get_recipes(self, obj):
         """Получение списка рецептов пользователя"""
-        recipes_limit = self.context['request'].query_params.get(
-            'recipes_limit'
-        )
-        recipes = obj.recipes.all()
-        if recipes_limit:
-            try:
-                recipes = recipes[:int(recipes_limit)]
-            except (TypeError, ValueError):
-                pass
-        return RecipeShortSerializer(recipes, many=True).data
-
-    def get_recipes_count(self, obj):
-        """Получение количества рецептов пользователя."""
-        return obj.recipes.count()
+        if hasattr(obj, 'recipes_preview'):
+            recipes = obj.recipes_preview
+        else:
+            recipes = obj.recipes.all()
+            recipes_limit = self.context['request'].query_params.get(
+                'recipes_limit'
+            )
+            if recipes_limit:
+                try:
+                    recipes = recipes[:int(recipes_limit)]
+                except (TypeError, ValueError):
+                    pass
+        return RecipeShortSerializer(
+            recipes, many=True, context=self.context
+        ).data
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -130,38 +175,86 @@ class IngredientRecipeViewSerializer(serializers.ModelSerializer):
         )
 
 
+class IngredientRecipeAddListSerializer(serializers.ListSerializer):
+    """Список ингредиентов рецепта, проверяемый целиком.
+
+    Ингредиенты ищутся по всем id сразу, а обо всех несуществующих id
+    сообщается одной ошибкой.
+    """
+
+    def to_internal_value(self, data):
+        items = super().to_internal_value(data)
+        ingredients, missing = resolve_pks(
+            ingredient_catalogue,
+            Ingredient.objects.all(),
+            [item['id'] for item in items],
+        )
+        if missing:
+            raise serializers.ValidationError(
+                'Ингредиенты с id {} не существуют.'.format(
+                    ', '.join(map(str, missing))
+                )
+            )
+        for item, ingredient in zip(items, ingredients):
+            item['id'] = ingredient
+        return items
+
+
 class IngredientRecipeAddSerializer(serializers.ModelSerializer):
     """Сериализатор добавления ингридиентов в рецепт."""
 
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    id = serializers.IntegerField()
 
     class Meta:
         model = RecipeIngredient
+        list_serializer_class = IngredientRecipeAddListSerializer
         fields = (
             'id',
             'amount',
         )
 
 
+class RecipeViewListSerializer(serializers.ListSerializer):
+    """Список рецептов, собираемый из кэшированных фрагментов."""
+
+    def to_representation(self, data):
+        if isinstance(data, Manager):
+            data = data.all()
+        return self.child.represent_many(list(data))
+
+
 class RecipeViewSerializer(serializers.ModelSerializer):
-    """Сериализатор рецептов."""
+    """Сериализатор рецептов.
+
+    Не зависящая от пользователя часть рецепта кэшируется в кэше
+    fragments по времени его изменения и версиям справочников и профилей.
+    Признаки is_favorited, is_in_shopping_cart и author.is_subscribed
+    накладываются поверх фрагмента из аннотаций with_user_flags. Связанные
+    данные подгружаются только для рецептов, которых нет в кэше.
+    Изображения отдаются в варианте из context['image_rendition'], по
+    умолчанию - исходные.
+    """
 
     tags = TagSerializer(many=True, read_only=True)
     author = UserViewSerializer(read_only=True)
     ingredients = IngredientRecipeViewSerializer(
         source='recipe_ingredients', many=True, read_only=True
     )
+    image = RenditionImageField(read_only=True)
+    image_renditions = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
+        list_serializer_class = RecipeViewListSerializer
         fields = (
             'id',
             'author',
             'ingredients',
             'name',
             'image',
+            'image_renditions',
             'text',
             'cooking_time',
             'tags',
@@ -169,7 +262,75 @@ class RecipeViewSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
         )
 
+    def to_representation(self, instance):
+        return self.represent_many([instance])[0]
+
+    def represent_many(self, recipes):
+        request = self.context.get('request')
+        version = md5('\n'.join((
+            request.build_absolute_uri('/') if request else '',
+            tag_catalogue.version,
+            ingredient_catalogue.version,
+            get_version(USERS_VERSION_KEY),
+            self.context.get('image_rendition', ''),
+        )).encode()).hexdigest()
+        keys = {
+            recipe.pk: 'recipe_fragment:{}:{}:{}'.format(
+                recipe.pk, recipe.updated_at.isoformat(), version
+            )
+            for recipe in recipes
+        }
+        cache = caches[FRAGMENT_CACHE_ALIAS]
+        fragments = cache.get_many(keys.values())
+        missing = [
+            recipe for recipe in recipes if keys[recipe.pk] not in fragments
+        ]
+        if missing:
+            user = request.user if request else AnonymousUser()
+            prefetch_related_objects(
+                missing, *Recipe.objects.related_lookups(user)
+            )
+            created = {
+                keys[recipe.pk]: super(
+                    RecipeViewSerializer, self
+                ).to_representation(recipe)
+                for recipe in missing
+            }
+            cache.set_many(
+                created, timeout=settings.RECIPE_FRAGMENT_CACHE_TIMEOUT
+            )
+            fragments.update(created)
+        return [
+            self.overlay_user_flags(fragments[keys[recipe.pk]], recipe)
+            for recipe in recipes
+        ]
+
+    def overlay_user_flags(self, fragment, recipe):
+        data = fragment.copy()
+        data['author'] = data['author'].copy()
+        if hasattr(recipe, 'author_is_subscribed'):
+            data['author']['is_subscribed'] = recipe.author_is_subscribed
+        else:
+            data['author']['is_subscribed'] = UserViewSerializer(
+                context=self.context
+            ).get_is_subscribed(recipe.author)
+        data['is_favorited'] = self.get_is_favorited(recipe)
+        data['is_in_shopping_cart'] = self.get_is_in_shopping_cart(recipe)
+        return data
+
+    def get_image_renditions(self, obj):
+        """Ссылки на готовые варианты изображения, пусто до обработки."""
+        request = self.context.get('request')
+        storage = obj.image.storage
+        return {
+            name: request.build_absolute_uri(storage.url(path))
+            if request else storage.url(path)
+            for name, path in obj.image_renditions.items()
+        }
+
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request')
         return bool(request
                     and request.user.is_authenticated
@@ -180,6 +341,8 @@ class RecipeViewSerializer(serializers.ModelSerializer):
                     )
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get('request')
         return bool(request
                     and request.user.is_authenticated
@@ -194,11 +357,11 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
     """Сериализатор создания и обновления рецептов."""
 
     author = UserViewSerializer(read_only=True)
-    image = Base64ImageField(required=True)
+    image = RawBase64ImageField(required=True)
     ingredients = IngredientRecipeAddSerializer(many=True, required=True)
     cooking_time = serializers.IntegerField(validators=(MinValueValidator(1),))
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(), many=True, required=True
+    tags = CatalogueRelatedListField(
+        catalogue=tag_catalogue, queryset=Tag.objects.all(), required=True
     )
 
     class Meta:
@@ -222,12 +385,17 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         return image
 
     def validate(self, data):
-        if 'ingredients' not in data or not data['ingredients']:
+        # При частичном обновлении отсутствующие ингредиенты и теги
+        # остаются прежними.
+        if (
+            ('ingredients' in data or not self.partial)
+            and not data.get('ingredients')
+        ):
             raise serializers.ValidationError({
                 'ingredients': 'Должен быть указан хотя бы один ингредиент.'
             })
 
-        if 'tags' not in data or not data['tags']:
+        if ('tags' in data or not self.partial) and not data.get('tags'):
             raise serializers.ValidationError({
                 'tags': 'Должен быть указан хотя бы один тег.'
             })
@@ -263,26 +431,90 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
-        recipe = Recipe.objects.create(
-            author=self.context.get('request').user, **validated_data
-        )
-        recipe.tags.set(tags)
-        self.create_ingredients(recipe, ingredients)
+
+        # Рецепт без тегов и ингредиентов не должен быть виден другим
+        # запросам: иначе он попадёт в кэш фрагментов и ответов.
+        with transaction.atomic():
+            recipe = Recipe.objects.create(
+                author=self.context.get('request').user, **validated_data
+            )
+            recipe.tags.set(tags)
+            self.create_ingredients(recipe, ingredients)
+            enqueue_image(recipe, 'image')
+
         return recipe
 
-    def update(self, instance, validated_data):
-        tags = validated_data.pop('tags')
-        ingredients = validated_data.pop('ingredients')
+    @staticmethod
+    def update_tags(recipe, tags):
+        """Замена тегов рецепта, если их набор изменился."""
+        if {tag.pk for tag in recipe.tags.all()} != {tag.pk for tag in tags}:
+            recipe.tags.set(tags)
 
-        instance = super().update(instance, validated_data)
+    @staticmethod
+    def update_ingredients(recipe, ingredients):
+        """Приведение ингредиентов рецепта к переданному списку.
+
+        Изменяются только отличающиеся строки: новые добавляются, у
+        существующих обновляется количество, лишние удаляются. Возвращает
+        True, если состав рецепта изменился.
+        """
+        amounts = {
+            ingredient['id'].pk: ingredient['amount']
+            for ingredient in ingredients
+        }
+        existing = {}
+        to_update = []
+        to_delete = []
+        for recipe_ingredient in recipe.recipe_ingredients.all():
+            ingredient_id = recipe_ingredient.ingredient_id
+            if ingredient_id not in amounts or ingredient_id in existing:
+                to_delete.append(recipe_ingredient.pk)
+                continue
+            existing[ingredient_id] = recipe_ingredient
+            if recipe_ingredient.amount != amounts[ingredient_id]:
+                recipe_ingredient.amount = amounts[ingredient_id]
+                to_update.append(recipe_ingredient)
+        to_create = [
+            RecipeIngredient(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount
+            )
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in existing
+        ]
+        if to_delete:
+            RecipeIngredient.objects.filter(pk__in=to_delete).delete()
+        if to_update:
+            RecipeIngredient.objects.bulk_update(to_update, ('amount',))
+        if to_create:
+            RecipeIngredient.objects.bulk_create(to_create)
+        return bool(to_delete or to_update or to_create)
 
-        instance.tags.set(tags)
-        RecipeIngredient.objects.filter(recipe=instance).delete()
-        self.create_ingredients(instance, ingredients)
+    def update(self, instance, validated_data):
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('ingredients', None)
+
+        with transaction.atomic():
+            if 'image' in validated_data:
+                clear_renditions(instance, 'image')
+            instance = super().update(instance, validated_data)
+            if 'image' in validated_data:
+                enqueue_image(instance, 'image')
+            if tags is not None:
+                self.update_tags(instance, tags)
+            if (
+                ingredients is not None
+                and self.update_ingredients(instance, ingredients)
+            ):
+                invalidate_recipe_shopping_carts((instance.id,))
 
         return instance
 
     def to_representation(self, instance):
+        # После создания или изменения рецепт перечитывается с признаками
+        # пользователя и новым временем изменения.
+        instance = Recipe.objects.with_user_flags(
+            self.context['request'].user
+        ).get(pk=instance.pk)
         return RecipeViewSerializer(instance, context=self.context).data
 
 
@@ -358,7 +590,8 @@ class CreateSubscriptionSerializer(serializers.ModelSerializer):
         return attrs
 
     def to_representation(self, instance):
-        return SubscriptionSerializer(
-            instance.author,
-            context=self.context
-        ).data
+        author = SubscriptionSerializer.prefetch_recipes(
+            User.objects.with_subscription_flag(instance.user),
+            self.context['request'],
+        ).get(pk=instance.author_id)
+        return SubscriptionSerializer(author, context=self.context).data
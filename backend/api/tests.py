@@ -0,0 +1,559 @@
+import json
+import os
+import shutil
+import tempfile
+from base64 import b64encode, urlsafe_b64encode
+from datetime import timedelta
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.catalogue import ingredient_catalogue, tag_catalogue
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from recipes.short_links import ShortLinkResolver
+from recipes.storage import content_storage
+from users.models import Subscription, User
+
+RECIPES_URL = '/api/recipes/'
+PAGE_SIZES = (6, 20)
+INGREDIENT_COUNTS = (1, 10)
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def clear_caches():
+    """Холодный кэш при загруженных в процесс справочниках.
+
+    Снимки справочников загружаются один раз на процесс, поэтому их
+    запросы в счёт не идут.
+    """
+    for alias in settings.CACHES:
+        caches[alias].clear()
+    tag_catalogue.refresh()
+    ingredient_catalogue.refresh()
+
+
+@override_settings(CATALOGUE_CHECK_INTERVAL=0)
+class RecipeListQueriesTest(TestCase):
+    """Число SQL-запросов списка рецептов не зависит от размера страницы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='reader@example.com',
+            username='reader',
+            password='password',
+            first_name='Читатель',
+            last_name='Рецептов',
+        )
+        authors = [
+            User.objects.create_user(
+                email=f'author{number}@example.com',
+                username=f'author{number}',
+                password='password',
+                first_name='Автор',
+                last_name=str(number),
+            )
+            for number in range(3)
+        ]
+        Subscription.objects.create(user=cls.user, author=authors[0])
+        tags = [
+            Tag.objects.create(name=f'Тег {number}', slug=f'tag{number}')
+            for number in range(3)
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(5)
+        ]
+        for number in range(max(PAGE_SIZES)):
+            recipe = Recipe.objects.create(
+                author=authors[number % len(authors)],
+                name=f'Рецепт {number}',
+                text='Описание',
+                image='recipes/images/recipe.png',
+                cooking_time=10,
+            )
+            recipe.tags.set(tags[:number % len(tags) + 1])
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe, ingredient=ingredient, amount=number + 1
+                )
+                for ingredient in ingredients[:number % len(ingredients) + 1]
+            )
+        cls.user.favorite_recipes.create(recipe=recipe)
+        cls.user.shopping_cart.create(recipe=recipe)
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def assert_list_queries(self, queries):
+        for page_size in PAGE_SIZES:
+            with self.subTest(page_size=page_size):
+                clear_caches()
+                with self.assertNumQueries(queries):
+                    response = self.client.get(
+                        RECIPES_URL, {'limit': page_size}
+                    )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data['results']), page_size)
+
+    def test_anonymous(self):
+        self.assert_list_queries(5)
+
+    def test_authenticated(self):
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.user)}'
+        )
+        self.assert_list_queries(6)
+
+
+@override_settings(CATALOGUE_CHECK_INTERVAL=0, MEDIA_ROOT=MEDIA_ROOT)
+class RecipeCreateQueriesTest(TestCase):
+    """Число SQL-запросов создания рецепта не зависит от ингредиентов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='author@example.com',
+            username='author',
+            password='password',
+            first_name='Автор',
+            last_name='Рецептов',
+        )
+        cls.tag = Tag.objects.create(name='Обед', slug='lunch')
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(max(INGREDIENT_COUNTS))
+        ]
+        buffer = BytesIO()
+        Image.new('RGB', (40, 40), '#e0a96d').save(buffer, 'PNG')
+        cls.image = (
+            'data:image/png;base64,' + b64encode(buffer.getvalue()).decode()
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_recipe(self, ingredients, queries):
+        with self.assertNumQueries(queries):
+            response = self.client.post(RECIPES_URL, {
+                'name': 'Рецепт',
+                'text': 'Описание',
+                'cooking_time': 10,
+                'image': self.image,
+                'tags': [self.tag.id],
+                'ingredients': [
+                    {'id': ingredient.id, 'amount': 10}
+                    for ingredient in ingredients
+                ],
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['ingredients']), len(ingredients))
+
+    def test_create(self):
+        # Два из запросов - SAVEPOINT и RELEASE SAVEPOINT транзакции
+        # создания внутри транзакции теста.
+        for count in INGREDIENT_COUNTS:
+            with self.subTest(count=count):
+                clear_caches()
+                self.create_recipe(self.ingredients[:count], 14)
+
+    def test_create_with_stale_catalogue(self):
+        """Ингредиенты не из снимка справочника ищутся одним запросом."""
+        for count in INGREDIENT_COUNTS:
+            with self.subTest(count=count):
+                clear_caches()
+                ingredients = [
+                    Ingredient.objects.create(
+                        name=f'Новый ингредиент {count} {number}',
+                        measurement_unit='г',
+                    )
+                    for number in range(count)
+                ]
+                with override_settings(CATALOGUE_CHECK_INTERVAL=60 * 60):
+                    self.create_recipe(ingredients, 15)
+
+
+class RecipeUpdateTest(TestCase):
+    """Обновление рецепта изменяет только отличающиеся ингредиенты."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='author@example.com',
+            username='author',
+            password='password',
+            first_name='Автор',
+            last_name='Рецептов',
+        )
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {number}', slug=f'tag{number}')
+            for number in range(2)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(4)
+        ]
+
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            author=self.user,
+            name='Рецепт',
+            text='Описание',
+            image='recipes/images/recipe.png',
+            cooking_time=10,
+        )
+        self.recipe.tags.set(self.tags[:1])
+        for amount, ingredient in enumerate(self.ingredients[:3], 1):
+            RecipeIngredient.objects.create(
+                recipe=self.recipe, ingredient=ingredient, amount=amount
+            )
+        self.url = f'{RECIPES_URL}{self.recipe.id}/'
+
+    def get_rows(self):
+        return {
+            ingredient_id: (pk, amount)
+            for pk, ingredient_id, amount in self.recipe.recipe_ingredients
+            .values_list('pk', 'ingredient_id', 'amount')
+        }
+
+    def test_partial_update_keeps_ingredients_and_tags(self):
+        rows = self.get_rows()
+        for data in ({'name': 'Новое название'}, {'tags': [self.tags[1].id]}):
+            with self.subTest(data=data):
+                response = self.client.patch(self.url, data, format='json')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(self.get_rows(), rows)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.name, 'Новое название')
+        self.assertEqual(
+            list(self.recipe.tags.values_list('id', flat=True)),
+            [self.tags[1].id],
+        )
+
+    def test_empty_ingredients_and_tags_rejected(self):
+        for data in ({'ingredients': []}, {'tags': []}):
+            with self.subTest(data=data):
+                response = self.client.patch(self.url, data, format='json')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(next(iter(data)), response.data)
+
+    def test_ingredients_diff(self):
+        first, second, third, fourth = self.ingredients
+        rows = self.get_rows()
+        response = self.client.patch(self.url, {'ingredients': [
+            {'id': first.id, 'amount': 1},
+            {'id': second.id, 'amount': 20},
+            {'id': fourth.id, 'amount': 40},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        updated = self.get_rows()
+        self.assertEqual(updated[first.id], rows[first.id])
+        self.assertEqual(updated[second.id], (rows[second.id][0], 20))
+        self.assertNotIn(third.id, updated)
+        self.assertNotIn(
+            updated[fourth.id][0], {pk for pk, _ in rows.values()}
+        )
+        self.assertEqual(updated[fourth.id][1], 40)
+
+
+class KeysetPaginationTest(TestCase):
+    """Постраничный обход рецептов по курсору в обе стороны."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            email='author@example.com',
+            username='author',
+            password='password',
+            first_name='Автор',
+            last_name='Рецептов',
+        )
+        for number in range(7):
+            Recipe.objects.create(
+                author=author,
+                name=f'Рецепт {number}',
+                text='Описание',
+                image='recipes/images/recipe.png',
+                cooking_time=10,
+            )
+        # Несколько рецептов с одинаковой датой публикации, в том числе на
+        # границах страниц: порядок между ними задаёт id.
+        now = timezone.now()
+        recipes = Recipe.objects.order_by('id')
+        Recipe.objects.filter(pk__in=recipes.values('pk')[:4]).update(
+            pub_date=now
+        )
+        Recipe.objects.filter(pk__in=recipes.values('pk')[4:]).update(
+            pub_date=now - timedelta(days=1)
+        )
+        cls.expected = list(
+            Recipe.objects.order_by('-pub_date', '-id')
+            .values_list('id', flat=True)
+        )
+
+    def setUp(self):
+        clear_caches()
+
+    def get_page(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.data['count'])
+        return response.data
+
+    def test_forward_and_back(self):
+        page = self.get_page(RECIPES_URL, {'paginate': 'cursor', 'limit': 3})
+        self.assertIsNone(page['previous'])
+        pages = [[recipe['id'] for recipe in page['results']]]
+        while page['next']:
+            page = self.get_page(page['next'])
+            pages.append([recipe['id'] for recipe in page['results']])
+        self.assertEqual(sum(pages, []), self.expected)
+        self.assertEqual([len(ids) for ids in pages], [3, 3, 1])
+
+        back = [pages[-1]]
+        while page['previous']:
+            page = self.get_page(page['previous'])
+            back.append([recipe['id'] for recipe in page['results']])
+        self.assertEqual(back[::-1], pages)
+
+    def test_invalid_cursor(self):
+        cursors = ['не курсор', urlsafe_b64encode(b'[1, 2]').decode()]
+        cursors += [
+            urlsafe_b64encode(json.dumps({'v': values, 'r': 0}).encode())
+            .decode()
+            for values in ([1], ['дата', 'id'], [None, None])
+        ]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                response = self.client.get(
+                    RECIPES_URL, {'paginate': 'cursor', 'cursor': cursor}
+                )
+                self.assertEqual(response.status_code, 404)
+
+
+@override_settings(CATALOGUE_CHECK_INTERVAL=0)
+class ShortLinkResolverTest(TestCase):
+    """Кэш коротких ссылок и его сброс при создании и удалении рецептов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email='author@example.com',
+            username='author',
+            password='password',
+            first_name='Автор',
+            last_name='Рецептов',
+        )
+        cls.recipes = [
+            cls.create_recipe(short_code) for short_code in (None, 'legacy')
+        ]
+
+    @classmethod
+    def create_recipe(cls, short_code=None):
+        return Recipe.objects.create(
+            author=cls.author,
+            name='Рецепт',
+            text='Описание',
+            image='recipes/images/recipe.png',
+            cooking_time=10,
+            short_code=short_code,
+        )
+
+    def setUp(self):
+        clear_caches()
+        self.resolver = ShortLinkResolver()
+
+    def test_resolve(self):
+        for recipe in self.recipes:
+            with self.subTest(short_code=recipe.short_code):
+                self.assertEqual(
+                    self.resolver.resolve(recipe.short_code),
+                    (recipe.pk, False),
+                )
+                with self.assertNumQueries(0):
+                    self.assertEqual(
+                        self.resolver.resolve(recipe.short_code),
+                        (recipe.pk, True),
+                    )
+
+    def test_unknown_code_is_cached(self):
+        self.assertEqual(self.resolver.resolve('unknown'), (None, False))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.resolver.resolve('unknown'), (None, True))
+
+    def test_new_recipe_replaces_unknown_code(self):
+        self.resolver.resolve('fresh')
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = self.create_recipe('fresh')
+        self.assertEqual(self.resolver.resolve('fresh'), (recipe.pk, False))
+
+    def test_deleted_recipe_is_evicted(self):
+        deleted, kept = self.recipes
+        for recipe in self.recipes:
+            self.resolver.resolve(recipe.short_code)
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipe.objects.get(pk=deleted.pk).delete()
+        self.assertEqual(
+            self.resolver.resolve(deleted.short_code), (None, False)
+        )
+        self.assertEqual(
+            self.resolver.resolve(kept.short_code), (kept.pk, True)
+        )
+
+    @override_settings(SHORT_LINK_CACHE_SIZE=1)
+    def test_least_recently_used_code_is_evicted(self):
+        first, second = self.recipes
+        self.resolver.resolve(first.short_code)
+        self.resolver.resolve(second.short_code)
+        self.assertEqual(
+            self.resolver.resolve(first.short_code), (first.pk, False)
+        )
+        self.assertEqual(self.resolver.stats()['evictions'], 2)
+
+    @override_settings(SHORT_LINK_STATS_INTERVAL=0)
+    def test_stats_are_logged(self):
+        with self.assertLogs('recipes.short_links', 'INFO') as logs:
+            self.resolver.resolve('unknown')
+            self.resolver.resolve('unknown')
+        self.assertIn('кодов 1, попаданий 0, промахов 1', logs.output[-1])
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, MEDIA_DELETE_GRACE_PERIOD=60)
+class ContentAddressedStorageTest(TestCase):
+    """Файл изображения удаляется после последней ссылки на него."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='author@example.com',
+            username='author',
+            password='password',
+            first_name='Автор',
+            last_name='Рецептов',
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.name = content_storage.save(
+            'recipes/images/recipe.PNG', ContentFile(b'image')
+        )
+
+    def make_old(self, name):
+        path = content_storage.path(name)
+        age = settings.MEDIA_DELETE_GRACE_PERIOD + 1
+        os.utime(path, (os.path.getatime(path) - age,) * 2)
+
+    def create_recipe(self):
+        return Recipe.objects.create(
+            author=self.user,
+            name='Рецепт',
+            text='Описание',
+            image=self.name,
+            cooking_time=10,
+        )
+
+    def test_same_content_is_stored_once(self):
+        name = content_storage.save('users/avatar.png', ContentFile(b'image'))
+        self.assertEqual(name, self.name)
+        self.assertTrue(name.startswith(settings.MEDIA_CONTENT_DIR))
+        self.assertTrue(name.endswith('.png'))
+
+    def test_referenced_file_is_kept(self):
+        first, second = self.create_recipe(), self.create_recipe()
+        self.make_old(self.name)
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(content_storage.exists(self.name))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(content_storage.exists(self.name))
+
+    def test_reference_from_other_model_is_counted(self):
+        recipe = self.create_recipe()
+        User.objects.filter(pk=self.user.pk).update(avatar=self.name)
+        self.make_old(self.name)
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.delete()
+        self.assertTrue(content_storage.exists(self.name))
+
+    def test_recent_file_is_kept(self):
+        content_storage.delete(self.name)
+        self.assertTrue(content_storage.exists(self.name))
+        self.make_old(self.name)
+        content_storage.delete(self.name)
+        self.assertFalse(content_storage.exists(self.name))
+
+
+class CountersTest(TestCase):
+    """Счётчики рецептов автора и добавлений в избранное."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.first, cls.second = [
+            User.objects.create_user(
+                email=f'author{number}@example.com',
+                username=f'author{number}',
+                password='password',
+                first_name='Автор',
+                last_name=str(number),
+            )
+            for number in range(2)
+        ]
+
+    def setUp(self):
+        self.recipe = Recipe.objects.create(
+            author=self.first,
+            name='Рецепт',
+            text='Описание',
+            image='recipes/images/recipe.png',
+            cooking_time=10,
+        )
+
+    def get_recipes_counts(self):
+        return list(
+            User.objects.filter(pk__in=(self.first.pk, self.second.pk))
+            .order_by('pk').values_list('recipes_count', flat=True)
+        )
+
+    def test_author_change_moves_recipe(self):
+        self.assertEqual(self.get_recipes_counts(), [1, 0])
+        self.recipe.author = self.second
+        self.recipe.save()
+        self.assertEqual(self.get_recipes_counts(), [0, 1])
+        self.recipe.name = 'Новое название'
+        self.recipe.save(update_fields=('name',))
+        self.recipe.delete()
+        self.assertEqual(self.get_recipes_counts(), [0, 0])
+
+    def test_counter_does_not_go_below_zero(self):
+        favorite = self.second.favorite_recipes.create(recipe=self.recipe)
+        Recipe.objects.filter(pk=self.recipe.pk).update(favorites_count=0)
+        favorite.delete()
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 0)
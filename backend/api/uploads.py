@@ -0,0 +1,66 @@
+import filetype
+from django.conf import settings
+from django.core.files.uploadhandler import (
+    StopUpload, TemporaryFileUploadHandler
+)
+from drf_extra_fields.fields import Base64ImageField
+
+HEADER_SIZE = 262
+INVALID_TYPE_MESSAGE = Base64ImageField.INVALID_TYPE_MESSAGE
+TOO_LARGE_MESSAGE = 'Размер изображения не должен превышать {max_size} МБ.'
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    """Потоковая запись загружаемого изображения во временный файл.
+
+    Файл проверяется по мере получения: формат определяется по первым
+    HEADER_SIZE байтам, размер ограничен IMAGE_UPLOAD_MAX_SIZE. На первой
+    ошибке временный файл удаляется, а загрузка прерывается
+    StopUpload(connection_reset=True), так что остаток тела запроса не
+    читается. Сообщения об ошибках сохраняются в errors по именам полей.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.errors = {}
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.header = b''
+        self.extension = None
+
+    def reject(self, message):
+        self.errors[self.field_name] = message
+        self.file.close()
+
+    def header_error(self):
+        self.extension = filetype.guess_extension(self.header)
+        if self.extension not in Base64ImageField.ALLOWED_TYPES:
+            return INVALID_TYPE_MESSAGE
+        return None
+
+    def receive_data_chunk(self, raw_data, start):
+        error = None
+        if start + len(raw_data) > settings.IMAGE_UPLOAD_MAX_SIZE:
+            error = TOO_LARGE_MESSAGE.format(
+                max_size=settings.IMAGE_UPLOAD_MAX_SIZE // 1024 ** 2
+            )
+        elif len(self.header) < HEADER_SIZE:
+            self.header += raw_data[:HEADER_SIZE - len(self.header)]
+            if len(self.header) == HEADER_SIZE:
+                error = self.header_error()
+        if error is not None:
+            self.reject(error)
+            raise StopUpload(connection_reset=True)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        if len(self.header) < HEADER_SIZE:
+            # Файл короче заголовка уже прочитан целиком.
+            error = self.header_error()
+            if error is not None:
+                self.reject(error)
+                return None
+        file = super().file_complete(file_size)
+        file.image_extension = self.extension
+        return file
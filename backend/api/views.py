@@ -1,36 +1,73 @@
-from django.db.models import Sum, Count
-from django.http import FileResponse
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum
+from django.http import (
+    Http404, HttpResponseNotModified, StreamingHttpResponse
+)
 from django.shortcuts import get_object_or_404, redirect
+from django.utils.http import parse_etags
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status
 from rest_framework.decorators import action
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.parsers import JSONParser
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
-from rest_framework.viewsets import ModelViewSet
+from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 from djoser import views as djoser_views
 
 
-from api.filters import IngredientFilter, RecipeFilter
+from api.conditional import conditional, normalize_query
+from api.exporters import DEFAULT_FORMAT, EXPORTERS, cache_content
+from api.filters import RecipeFilter
+from api.negotiation import IgnoreFormatContentNegotiation
 from api.paginators import BasePaginator
+from api.parsers import ImageMultiPartParser, RawImageParser
 from api.permissions import IsAuthorOrReadOnly
 from api.serializers import (
     AvatarSerializer, TagSerializer,
     IngredientSerializer, CreateSubscriptionSerializer,
     SubscriptionSerializer, RecipeCreateUpdateSerializer,
+    RecipeViewSerializer,
     FavoriteSerializer, ShoppingCartSerializer
 )
-from api.utils import export_shopping_cart
+from recipes.cache import (
+    FAVORITES_VERSION_KEY, RECIPES_VERSION_KEY, SUBSCRIPTIONS_VERSION_KEY,
+    USERS_VERSION_KEY, get_shopping_cart_version, get_version
+)
+from recipes.catalogue import ingredient_catalogue, tag_catalogue
+from recipes.images import clear_renditions
 from recipes.models import (
     Ingredient, Recipe, Tag, User, RecipeIngredient, ShoppingCart, Favorite
 )
+from recipes.short_links import short_link_resolver
 from users.models import Subscription
 
 
 def redirect_short_link(request, short_code):
-    """Перенаправление по короткой ссылке на страницу рецепта"""
-    recipe = get_object_or_404(Recipe, short_code=short_code)
-    return redirect(f'/recipes/{recipe.id}/')
+    """Перенаправление по короткой ссылке на страницу рецепта.
+
+    Заголовок X-Cache показывает, найден ли код в кэше коротких ссылок.
+    """
+    pk, cached = short_link_resolver.resolve(short_code)
+    if pk is None:
+        raise Http404('Рецепт не найден.')
+    response = redirect(f'/recipes/{pk}/')
+    response['X-Cache'] = 'HIT' if cached else 'MISS'
+    return response
+
+
+def get_user_versions(user):
+    """Версии данных, от которых зависят признаки рецептов пользователя."""
+    if not user.is_authenticated:
+        return ()
+    return (
+        user.id,
+        get_version(FAVORITES_VERSION_KEY.format(user.id)),
+        get_shopping_cart_version(user.id),
+        get_version(SUBSCRIPTIONS_VERSION_KEY.format(user.id)),
+    )
 
 
 class RecipeViewSet(ModelViewSet):
@@ -38,8 +75,77 @@ class RecipeViewSet(ModelViewSet):
 
     queryset = Recipe.objects.all()
     pagination_class = BasePaginator
+    cursor_ordering = ('-pub_date', '-id')
     filterset_class = RecipeFilter
     filter_backends = (DjangoFilterBackend,)
+    parser_classes = (JSONParser, ImageMultiPartParser)
+
+    def get_queryset(self):
+        """Рецепты с признаками для пользователя.
+
+        Связанные данные подгружает RecipeViewSerializer и только для
+        рецептов, которых нет в кэше. Число SQL-запросов не зависит от
+        размера страницы.
+        """
+        return self.queryset.with_user_flags(self.request.user)
+
+    def get_count_cache_key(self):
+        """Ключ кэша количества рецептов для текущих фильтров."""
+        if self.action != 'list':
+            return None
+        params = self.request.query_params
+        user = self.request.user
+        key = [get_version(RECIPES_VERSION_KEY)]
+        key += [
+            sorted(params.getlist(name))
+            for name in RecipeFilter.base_filters
+        ]
+        if user.is_authenticated:
+            if 'is_favorited' in params:
+                key.append(get_version(FAVORITES_VERSION_KEY.format(user.id)))
+            if 'is_in_shopping_cart' in params:
+                key.append(get_shopping_cart_version(user.id))
+        return key
+
+    def get_validators(self):
+        """Валидаторы условных запросов для списка и страницы рецепта.
+
+        Ответ зависит от рецептов, справочников, профилей авторов и
+        признаков текущего пользователя. Last-Modified отдаётся только
+        анонимам: время изменения рецепта не учитывает избранное и подписки.
+        """
+        user = self.request.user
+        parts = [
+            self.request.build_absolute_uri('/'),
+            tag_catalogue.version,
+            ingredient_catalogue.version,
+            get_version(USERS_VERSION_KEY),
+            *get_user_versions(user),
+        ]
+        if self.action == 'list':
+            parts += [
+                get_version(RECIPES_VERSION_KEY),
+                normalize_query(self.request.query_params),
+            ]
+            return parts, None
+        try:
+            updated_at = Recipe.objects.filter(
+                pk=int(self.kwargs['pk'])
+            ).values_list('updated_at', flat=True).first()
+        except ValueError:
+            return None
+        if updated_at is None:
+            return None
+        parts += [self.kwargs['pk'], updated_at.isoformat()]
+        return parts, None if user.is_authenticated else updated_at
+
+    @conditional(vary=('Accept', 'Authorization'), cache_anonymous=True)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional(vary=('Accept', 'Authorization'), cache_anonymous=True)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
     def get_permissions(self):
         if self.action in ['list', 'retrieve', 'get_link']:
@@ -57,8 +163,17 @@ class RecipeViewSet(ModelViewSet):
             return super().get_permissions()
 
     def get_serializer_class(self):
+        if self.action in ('list', 'retrieve'):
+            return RecipeViewSerializer
         return RecipeCreateUpdateSerializer
 
+    def get_serializer_context(self):
+        """В списке рецептов вместо изображений отдаются миниатюры."""
+        context = super().get_serializer_context()
+        if self.action == 'list':
+            context['image_rendition'] = 'thumbnail'
+        return context
+
     @action(methods=('POST',), detail=True, url_path='favorite')
     def favorite(self, request, pk=None):
         user = request.user
@@ -132,51 +247,109 @@ class RecipeViewSet(ModelViewSet):
     @action(
         methods=('GET',),
         detail=False,
-        url_path='download_shopping_cart'
+        url_path='download_shopping_cart',
+        content_negotiation_class=IgnoreFormatContentNegotiation,
     )
     def download_shopping_cart(self, request):
+        """Выгрузка списка покупок в формате из параметра format.
+
+        Готовый файл кэшируется по версии списка покупок пользователя, а
+        версия отдаётся в ETag: для неизменившегося списка возвращается 304.
+        """
         user = request.user
-        user_recipes = [item.recipe_id for item in
-                        ShoppingCart.objects.filter(user=user)]
+        file_format = request.query_params.get('format', DEFAULT_FORMAT)
+        if file_format not in EXPORTERS:
+            raise ValidationError({
+                'format': 'Допустимые форматы: {}.'.format(
+                    ', '.join(EXPORTERS)
+                )
+            })
+        version = get_shopping_cart_version(user.id)
+        etag = f'"{version}-{file_format}"'
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            return HttpResponseNotModified(headers={'ETag': etag})
         to_buy = (
-            RecipeIngredient.objects.filter(recipe__in=user_recipes)
-            .values('ingredient')
+            RecipeIngredient.objects
+            .filter(recipe__in_shopping_cart__user=user)
+            .values_list('ingredient__name', 'ingredient__measurement_unit')
             .annotate(amount=Sum('amount'))
+            .order_by('ingredient__name', 'ingredient__measurement_unit')
         )
-        to_buy_list = []
-        for item in to_buy:
-            ingredient = Ingredient.objects.get(pk=item['ingredient'])
-            amount = item['amount']
-            to_buy_list.append({
-                'Ингредиент': ingredient.name,
-                'Ед.изм': ingredient.measurement_unit,
-                'Количество': amount
-            })
-        return FileResponse(
-            export_shopping_cart(to_buy_list),
-            as_attachment=True,
-            filename='shopping_list_{}.xlsx'.format(user.username)
+        exporter = EXPORTERS[file_format](to_buy)
+        cache_key = f'shopping_list:{user.id}:{version}:{file_format}'
+        content = cache.get(cache_key)
+        if content is None:
+            content = cache_content(
+                exporter,
+                cache_key,
+                settings.SHOPPING_LIST_CACHE_TIMEOUT,
+                settings.SHOPPING_LIST_CACHE_MAX_SIZE,
+            )
+        else:
+            content = (content,)
+        response = StreamingHttpResponse(
+            content, content_type=exporter.content_type
+        )
+        response['Content-Disposition'] = exporter.get_content_disposition(
+            user.username
         )
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
 
+class CatalogueViewSet(ReadOnlyModelViewSet):
+    """Базовый вьюсет справочника, читающий данные из памяти процесса."""
 
-class TagViewSet(ModelViewSet):
+    catalogue = None
+    permission_classes = (AllowAny,)
+
+    def get_objects(self):
+        return self.catalogue.all()
+
+    def get_validators(self):
+        return (
+            self.catalogue.version,
+            normalize_query(self.request.query_params),
+            self.kwargs.get(self.lookup_field),
+        ), None
+
+    @conditional()
+    def list(self, request, *args, **kwargs):
+        serializer = self.get_serializer(self.get_objects(), many=True)
+        return Response(serializer.data)
+
+    @conditional()
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            obj = self.catalogue.get(int(kwargs[self.lookup_field]))
+        except ValueError:
+            obj = None
+        if obj is None:
+            raise NotFound
+        return Response(self.get_serializer(obj).data)
+
+
+class TagViewSet(CatalogueViewSet):
     """Вьюсет для работы с тегами."""
 
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
-    permission_classes = (AllowAny,)
-    http_method_names = ('get',)
+    catalogue = tag_catalogue
 
 
-class IngredientViewSet(ModelViewSet):
+class IngredientViewSet(CatalogueViewSet):
     """Вьюсет для работы с ингредиентами."""
 
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
-    filter_backends = (DjangoFilterBackend,)
-    filterset_class = IngredientFilter
-    permission_classes = (AllowAny,)
-    http_method_names = ('get',)
+    catalogue = ingredient_catalogue
+
+    def get_objects(self):
+        name = self.request.query_params.get('name')
+        if name:
+            return self.catalogue.search(name)
+        return super().get_objects()
 
 
 class UserViewSet(djoser_views.UserViewSet):
@@ -184,12 +357,32 @@ class UserViewSet(djoser_views.UserViewSet):
 
     queryset = User.objects.all()
     pagination_class = BasePaginator
+    cursor_ordering = ('username', 'id')
     lookup_field = 'id'
+    upload_field = 'avatar'
     search_fields = (
         'username',
         'email',
     )
 
+    def get_queryset(self):
+        return super().get_queryset().with_subscription_flag(
+            self.request.user
+        )
+
+    def get_count_cache_key(self):
+        """Ключ кэша количества пользователей в общем списке."""
+        if self.action != 'list':
+            return None
+        return [get_version(USERS_VERSION_KEY)]
+
+    def get_serializer_context(self):
+        """В списках пользователей вместо аватаров отдаются миниатюры."""
+        context = super().get_serializer_context()
+        if self.action in ('list', 'subscriptions'):
+            context['image_rendition'] = 'thumbnail'
+        return context
+
     def get_permissions(self):
         if self.action in ['list', 'retrieve', 'create']:
             return (AllowAny(),)
@@ -216,7 +409,8 @@ class UserViewSet(djoser_views.UserViewSet):
         methods=('PUT',),
         detail=False,
         url_path='me/avatar',
-        serializer_class=AvatarSerializer
+        serializer_class=AvatarSerializer,
+        parser_classes=(JSONParser, ImageMultiPartParser, RawImageParser),
     )
     def avatar(self, request):
         serializer = self.get_serializer(request.user, data=request.data)
@@ -226,7 +420,9 @@ class UserViewSet(djoser_views.UserViewSet):
 
     @avatar.mapping.delete
     def delete_avatar(self, request):
-        request.user.avatar.delete()
+        with transaction.atomic():
+            clear_renditions(request.user, 'avatar')
+            request.user.avatar.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -236,12 +432,13 @@ class UserViewSet(djoser_views.UserViewSet):
     )
     def subscriptions(self, request):
         user = request.user
-        queryset = User.objects.filter(followed_by__user=user).annotate(
-            recipes_count=Count('recipes')
-        )
+        queryset = User.objects.filter(
+            followed_by__user=user
+        ).with_subscription_flag(user).order_by('username')
+        queryset = SubscriptionSerializer.prefetch_recipes(queryset, request)
         pages = self.paginate_queryset(queryset)
         serializer = SubscriptionSerializer(
-            pages, many=True, context={'request': request}
+            pages, many=True, context=self.get_serializer_context()
         )
         return self.get_paginated_response(serializer.data)
 
@@ -1,4 +1,5 @@
 import os
+import sys
 from distutils.util import strtobool
 from pathlib import Path
 
@@ -78,6 +79,114 @@ DATABASES = {
     }
 }
 
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django_redis.cache.RedisCache',
+}
+RESPONSE_CACHE_LOCATIONS = {
+    'locmem': 'foodgram_responses',
+    'file': '/tmp/foodgram_responses',
+    'redis': 'redis://127.0.0.1:6379/1',
+}
+RESPONSE_CACHE_BACKEND = os.getenv('RESPONSE_CACHE_BACKEND', 'locmem')
+FRAGMENT_CACHE_LOCATIONS = {
+    'locmem': 'foodgram_fragments',
+    'file': '/tmp/foodgram_fragments',
+    'redis': 'redis://127.0.0.1:6379/2',
+}
+FRAGMENT_CACHE_BACKEND = os.getenv('FRAGMENT_CACHE_BACKEND', 'locmem')
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.filebased.FileBasedCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', '/tmp/foodgram_cache'),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 10000)),
+            'CULL_FREQUENCY': int(os.getenv('CACHE_CULL_FREQUENCY', 3)),
+        },
+    },
+    # Общие версии данных (recipes.cache) не должны вытесняться вместе с
+    # остальными ключами, поэтому хранятся отдельно и без ограничений.
+    # Версии пользователей хранятся в default с USER_VERSION_TIMEOUT.
+    'versions': {
+        'BACKEND': os.getenv(
+            'VERSIONS_CACHE_BACKEND',
+            'django.core.cache.backends.filebased.FileBasedCache'
+        ),
+        'LOCATION': os.getenv(
+            'VERSIONS_CACHE_LOCATION', '/tmp/foodgram_versions'
+        ),
+        'TIMEOUT': None,
+        'OPTIONS': {'MAX_ENTRIES': sys.maxsize},
+    },
+    'responses': {
+        'BACKEND': CACHE_BACKENDS.get(
+            RESPONSE_CACHE_BACKEND, RESPONSE_CACHE_BACKEND
+        ),
+        'LOCATION': os.getenv(
+            'RESPONSE_CACHE_LOCATION',
+            RESPONSE_CACHE_LOCATIONS.get(RESPONSE_CACHE_BACKEND, ''),
+        ),
+        'TIMEOUT': int(os.getenv('RESPONSE_CACHE_TIMEOUT', 60 * 5)),
+    },
+    # Ключи фрагментов включают время изменения рецепта и версии данных,
+    # поэтому кэш может быть своим у каждого процесса.
+    'fragments': {
+        'BACKEND': CACHE_BACKENDS.get(
+            FRAGMENT_CACHE_BACKEND, FRAGMENT_CACHE_BACKEND
+        ),
+        'LOCATION': os.getenv(
+            'FRAGMENT_CACHE_LOCATION',
+            FRAGMENT_CACHE_LOCATIONS.get(FRAGMENT_CACHE_BACKEND, ''),
+        ),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('FRAGMENT_CACHE_MAX_ENTRIES', 5000)),
+        },
+    },
+}
+
+SHOPPING_LIST_CACHE_TIMEOUT = int(
+    os.getenv('SHOPPING_LIST_CACHE_TIMEOUT', 60 * 60 * 24)
+)
+SHOPPING_LIST_CACHE_MAX_SIZE = int(
+    os.getenv('SHOPPING_LIST_CACHE_MAX_SIZE', 1024 * 1024)
+)
+
+RECIPE_FRAGMENT_CACHE_TIMEOUT = int(
+    os.getenv('RECIPE_FRAGMENT_CACHE_TIMEOUT', 60 * 60 * 24)
+)
+
+USER_VERSION_TIMEOUT = int(
+    os.getenv('USER_VERSION_TIMEOUT', 60 * 60 * 24 * 7)
+)
+
+COUNT_CACHE_TIMEOUT = int(os.getenv('COUNT_CACHE_TIMEOUT', 60))
+COUNT_ESTIMATE_THRESHOLD = int(os.getenv('COUNT_ESTIMATE_THRESHOLD', 100000))
+
+CATALOGUE_CHECK_INTERVAL = float(os.getenv('CATALOGUE_CHECK_INTERVAL', 5))
+SHORT_LINK_CACHE_SIZE = int(os.getenv('SHORT_LINK_CACHE_SIZE', 10000))
+SHORT_LINK_STATS_INTERVAL = float(
+    os.getenv('SHORT_LINK_STATS_INTERVAL', 60 * 5)
+)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'recipes': {
+            'handlers': ['console'],
+            'level': os.getenv('RECIPES_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
+
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -108,11 +217,35 @@ STATIC_ROOT = BASE_DIR / 'collected_static'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = '/media/'
+MEDIA_CONTENT_DIR = 'content'
+# Файлы изображений моложе этого возраста в секундах не удаляются: на них
+# может ссылаться объект, который ещё не сохранён.
+MEDIA_DELETE_GRACE_PERIOD = int(
+    os.getenv('MEDIA_DELETE_GRACE_PERIOD', 60 * 60)
+)
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+IMAGE_MAX_SIZE = int(os.getenv('IMAGE_MAX_SIZE', 2048))
+IMAGE_RENDITIONS = {
+    'thumbnail': {'size': (320, 320), 'crop': True},
+    'medium': {'size': (800, 800), 'crop': False},
+}
+IMAGE_RENDITIONS_DIR = 'renditions'
+IMAGE_QUALITY = int(os.getenv('IMAGE_QUALITY', 85))
+IMAGE_WORKER_THREADS = int(os.getenv('IMAGE_WORKER_THREADS', 2))
+IMAGE_JOB_TIMEOUT = int(os.getenv('IMAGE_JOB_TIMEOUT', 60 * 5))
+IMAGE_JOB_MAX_ATTEMPTS = int(os.getenv('IMAGE_JOB_MAX_ATTEMPTS', 3))
+
+IMAGE_UPLOAD_MAX_SIZE = int(
+    os.getenv('IMAGE_UPLOAD_MAX_SIZE', 20 * 1024 * 1024)
+)
+
 DATA_UPLOAD_MAX_MEMORY_SIZE = 52428800
-FILE_UPLOAD_MAX_MEMORY_SIZE = 52428800
+FILE_UPLOAD_MAX_MEMORY_SIZE = int(
+    os.getenv('FILE_UPLOAD_MAX_MEMORY_SIZE', 1024 * 1024)
+)
+FILE_UPLOAD_TEMP_DIR = os.getenv('FILE_UPLOAD_TEMP_DIR')
 
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
@@ -1,6 +1,10 @@
 from django.contrib import admin
 
-from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from recipes.cache import invalidate_recipe_shopping_carts
+from recipes.images import clear_renditions, enqueue_image
+from recipes.models import (
+    ImageJob, Ingredient, Recipe, RecipeIngredient, Tag
+)
 
 
 @admin.register(Ingredient)
@@ -46,6 +50,7 @@ class RecipeAdmin(admin.ModelAdmin):
         'author',
         'tags_list',
         'ingredients_list',
+        'favorites_count',
         'pub_date',
     )
     search_fields = (
@@ -53,6 +58,7 @@ class RecipeAdmin(admin.ModelAdmin):
         'author__username',
     )
     list_filter = ('tags',)
+    readonly_fields = ('favorites_count', 'image_renditions')
     inlines = (RecipeIngredientInLine,)
 
     def tags_list(self, obj):
@@ -66,3 +72,32 @@ class RecipeAdmin(admin.ModelAdmin):
         )
 
     ingredients_list.short_description = 'Ингредиенты'
+
+    def save_model(self, request, obj, form, change):
+        if 'image' in form.changed_data:
+            previous = form.initial.get('image')
+            clear_renditions(obj, 'image', previous and previous.name)
+        super().save_model(request, obj, form, change)
+        if 'image' in form.changed_data:
+            enqueue_image(obj, 'image')
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        if change:
+            invalidate_recipe_shopping_carts((form.instance.id,))
+
+
+@admin.register(ImageJob)
+class ImageJobAdmin(admin.ModelAdmin):
+    """Очередь обработки изображений."""
+
+    list_display = (
+        'source',
+        'model',
+        'object_id',
+        'status',
+        'attempts',
+        'created_at',
+    )
+    list_filter = ('status', 'model')
+    readonly_fields = ('error',)
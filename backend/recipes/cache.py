@@ -0,0 +1,82 @@
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.db import transaction
+
+from recipes.models import ShoppingCart
+
+RECIPES_VERSION_KEY = 'recipes_version'
+USERS_VERSION_KEY = 'users_version'
+INGREDIENTS_VERSION_KEY = 'ingredients_version'
+TAGS_VERSION_KEY = 'tags_version'
+SHORT_LINKS_VERSION_KEY = 'short_links_version'
+FAVORITES_VERSION_KEY = 'favorites_version:{}'
+SHOPPING_CART_VERSION_KEY = 'shopping_cart_version:{}'
+SUBSCRIPTIONS_VERSION_KEY = 'subscriptions_version:{}'
+VERSIONS_CACHE_ALIAS = 'versions'
+
+
+def get_version_cache(key):
+    """Кэш и срок хранения версии по ключу key.
+
+    Общие версии хранятся в кэше versions без вытеснения. Версии
+    пользователей (ключи вида 'имя:id') заводятся на каждого активного
+    пользователя, поэтому хранятся в основном кэше с ограниченным сроком
+    USER_VERSION_TIMEOUT.
+    """
+    if ':' in key:
+        return caches[DEFAULT_CACHE_ALIAS], settings.USER_VERSION_TIMEOUT
+    return caches[VERSIONS_CACHE_ALIAS], None
+
+
+def get_version(key):
+    """Текущая версия данных, хранящаяся в кэше под ключом key.
+
+    Версия - случайная строка, а не счётчик: если ключ пропадёт из кэша,
+    новая версия не совпадёт ни с одной из выданных ранее.
+    """
+    cache, timeout = get_version_cache(key)
+    version = cache.get(key)
+    if version is None:
+        version = uuid4().hex
+        if not cache.add(key, version, timeout=timeout):
+            version = cache.get(key, version)
+    return version
+
+
+def set_versions(keys):
+    """Запись новых версий по ключам keys."""
+    batches = {}
+    for key in keys:
+        batches.setdefault(get_version_cache(key), {})[key] = uuid4().hex
+    for (cache, timeout), versions in batches.items():
+        cache.set_many(versions, timeout=timeout)
+
+
+def bump_versions(keys):
+    """Сброс версий по ключам keys после фиксации транзакции."""
+    keys = set(keys)
+    if not keys:
+        return
+    transaction.on_commit(lambda: set_versions(keys))
+
+
+def get_shopping_cart_version(user_id):
+    """Текущая версия списка покупок пользователя."""
+    return get_version(SHOPPING_CART_VERSION_KEY.format(user_id))
+
+
+def bump_shopping_cart_versions(user_ids):
+    bump_versions(
+        SHOPPING_CART_VERSION_KEY.format(user_id) for user_id in user_ids
+    )
+
+
+def invalidate_recipe_shopping_carts(recipe_ids):
+    """Сброс списков покупок пользователей, добавивших рецепты в корзину."""
+    bump_shopping_cart_versions(
+        ShoppingCart.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('user_id', flat=True)
+    )
@@ -0,0 +1,178 @@
+from array import array
+from bisect import bisect_left
+from time import monotonic
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from recipes.cache import (
+    INGREDIENTS_VERSION_KEY, TAGS_VERSION_KEY, get_version
+)
+from recipes.constants import INGREDIENT_SEARCH_LIMIT
+from recipes.models import Ingredient, Tag
+
+
+class Snapshot:
+    """Неизменяемый снимок справочника с массивом id по возрастанию."""
+
+    ids = None
+
+    def make(self, index):
+        raise NotImplementedError
+
+    def index_of(self, pk):
+        index = bisect_left(self.ids, pk)
+        if index < len(self.ids) and self.ids[index] == pk:
+            return index
+        return None
+
+    def get(self, pk):
+        index = self.index_of(pk)
+        return None if index is None else self.make(index)
+
+    def all(self):
+        return [self.make(index) for index in range(len(self.ids))]
+
+
+class IngredientSnapshot(Snapshot):
+    """Неизменяемый снимок справочника ингредиентов.
+
+    Данные хранятся в параллельных массивах, упорядоченных по id, плюс
+    отсортированный индекс названий в нижнем регистре для поиска по префиксу.
+    """
+
+    def __init__(self, rows):
+        self.ids = array('q')
+        names = []
+        units = []
+        for pk, name, measurement_unit in rows:
+            self.ids.append(pk)
+            names.append(name)
+            units.append(measurement_unit)
+        self.names = tuple(names)
+        self.units = tuple(units)
+        self.lower_names = tuple(name.lower() for name in names)
+        self.name_order = tuple(sorted(
+            range(len(names)), key=lambda i: (self.lower_names[i], names[i])
+        ))
+        self.sorted_lower_names = tuple(
+            self.lower_names[i] for i in self.name_order
+        )
+
+    def make(self, index):
+        return Ingredient.from_db(
+            DEFAULT_DB_ALIAS,
+            ('id', 'name', 'measurement_unit'),
+            (self.ids[index], self.names[index], self.units[index]),
+        )
+
+    def search(self, query, limit=INGREDIENT_SEARCH_LIMIT):
+        """Поиск по части названия без учёта регистра.
+
+        Сначала идут названия, начинающиеся с query, затем содержащие его.
+        """
+        query = query.lower()
+        found = []
+        position = bisect_left(self.sorted_lower_names, query)
+        while (
+            len(found) < limit
+            and position < len(self.sorted_lower_names)
+            and self.sorted_lower_names[position].startswith(query)
+        ):
+            found.append(self.name_order[position])
+            position += 1
+        for index in self.name_order:
+            if len(found) >= limit:
+                break
+            name = self.lower_names[index]
+            if query in name and not name.startswith(query):
+                found.append(index)
+        return [self.make(index) for index in found]
+
+
+class TagSnapshot(Snapshot):
+    """Неизменяемый снимок справочника тегов, упорядоченный по id."""
+
+    def __init__(self, rows):
+        self.ids = array('q')
+        values = []
+        for pk, name, slug in rows:
+            self.ids.append(pk)
+            values.append((name, slug))
+        self.values = tuple(values)
+
+    def make(self, index):
+        return Tag.from_db(
+            DEFAULT_DB_ALIAS,
+            ('id', 'name', 'slug'),
+            (self.ids[index], *self.values[index]),
+        )
+
+
+class Catalogue:
+    """Справочник, загружаемый в память процесса при первом обращении.
+
+    Снимок перезагружается, когда меняется его версия в общем кэше. Версия
+    проверяется не чаще раза в CATALOGUE_CHECK_INTERVAL секунд.
+    """
+
+    def __init__(self, model, fields, snapshot_class, version_key):
+        self.model = model
+        self.fields = fields
+        self.snapshot_class = snapshot_class
+        self.version_key = version_key
+        self._snapshot = None
+        self._version = None
+        self._checked_at = None
+
+    def refresh(self):
+        """Перезагрузка снимка, если его версия в кэше изменилась."""
+        now = monotonic()
+        if (
+            self._checked_at is None
+            or now - self._checked_at >= settings.CATALOGUE_CHECK_INTERVAL
+        ):
+            version = get_version(self.version_key)
+            if self._snapshot is None or version != self._version:
+                self._snapshot = self.snapshot_class(
+                    self.model.objects.order_by('id').values_list(
+                        *self.fields
+                    )
+                )
+                self._version = version
+            self._checked_at = now
+
+    @property
+    def snapshot(self):
+        self.refresh()
+        return self._snapshot
+
+    @property
+    def version(self):
+        """Версия данных, из которых построен текущий снимок."""
+        self.refresh()
+        return self._version
+
+    def get(self, pk):
+        return self.snapshot.get(pk)
+
+    def all(self):
+        return self.snapshot.all()
+
+
+class IngredientCatalogue(Catalogue):
+    """Справочник ингредиентов с поиском по названию."""
+
+    def search(self, query):
+        return self.snapshot.search(query)
+
+
+ingredient_catalogue = IngredientCatalogue(
+    Ingredient,
+    ('id', 'name', 'measurement_unit'),
+    IngredientSnapshot,
+    INGREDIENTS_VERSION_KEY,
+)
+tag_catalogue = Catalogue(
+    Tag, ('id', 'name', 'slug'), TagSnapshot, TAGS_VERSION_KEY
+)
@@ -7,3 +7,5 @@ MAX_VALUE = 32000
 USERNAME_LENGTH = 150
 MAX_USERNAME = 30
 PAGINATOR_SIZE = 10
+INGREDIENT_SEARCH_LIMIT = 20
+SHORT_CODE_MIN_LENGTH = 6
@@ -0,0 +1,65 @@
+from django.apps import apps as global_apps
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete
+
+COUNTERS = (
+    ('recipes.recipe', 'favorites_count', 'recipes.favorite', 'recipe'),
+    (
+        'recipes.recipe',
+        'shopping_cart_count',
+        'recipes.shoppingcart',
+        'recipe',
+    ),
+    ('users.user', 'recipes_count', 'recipes.recipe', 'author'),
+    ('users.user', 'followers_count', 'users.subscription', 'author'),
+)
+
+
+def shift_counter(model, pk, field_name, delta):
+    """Изменение счётчика строки на delta, но не ниже нуля.
+
+    Если данные меняли в обход сигналов, отрицательное значение не прошло
+    бы проверку PositiveIntegerField. Обновление выполняется в базе через
+    F(), без чтения строки.
+    """
+    queryset = model._default_manager.filter(pk=pk)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field_name}__gte': -delta})
+    queryset.update(**{field_name: F(field_name) + delta})
+
+
+def change_counter(model, pk, field_name, signal, created=False):
+    """Изменение счётчика строки на единицу по сигналу о связанном объекте.
+
+    Счётчик растёт при создании объекта и уменьшается при удалении.
+    """
+    if signal is post_delete:
+        shift_counter(model, pk, field_name, -1)
+    elif created:
+        shift_counter(model, pk, field_name, 1)
+
+
+def reconcile_counters(apps=global_apps):
+    """Пересчёт всех счётчиков COUNTERS запросом UPDATE на каждый.
+
+    Обновляются только строки с расходящимся значением. Возвращает
+    словарь {счётчик: количество исправленных строк}.
+    """
+    fixed = {}
+    for label, field_name, related_label, related_field in COUNTERS:
+        model = apps.get_model(label)
+        actual = Coalesce(
+            Subquery(
+                apps.get_model(related_label)._default_manager.filter(
+                    **{related_field: OuterRef('pk')}
+                ).order_by().values(related_field).annotate(
+                    count=Count('pk')
+                ).values('count')
+            ),
+            0,
+        )
+        fixed[f'{label}.{field_name}'] = model._default_manager.exclude(
+            **{field_name: actual}
+        ).update(**{field_name: actual})
+    return fixed
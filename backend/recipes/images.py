@@ -0,0 +1,265 @@
+import posixpath
+from datetime import timedelta
+from hashlib import sha256
+from io import BytesIO
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from recipes.cache import RECIPES_VERSION_KEY, USERS_VERSION_KEY, bump_versions
+from recipes.models import ImageJob
+from recipes.storage import IMAGE_FIELDS
+
+VERSION_KEYS = {
+    'recipes.recipe': RECIPES_VERSION_KEY,
+    'users.user': USERS_VERSION_KEY,
+}
+EXTENSIONS = {
+    'JPEG': 'jpg',
+    'PNG': 'png',
+    'WEBP': 'webp',
+}
+
+
+def renditions_field(field_name):
+    return f'{field_name}_renditions'
+
+
+def release_file(storage, name):
+    """Удаление файла после фиксации транзакции.
+
+    Хранилище с подсчётом ссылок (ContentAddressedStorage) оставит файл,
+    если на него ссылаются другие объекты.
+    """
+    if name:
+        transaction.on_commit(lambda: storage.delete(name))
+
+
+def clear_renditions(instance, field_name, previous=None):
+    """Сброс вариантов прежнего изображения перед сохранением нового.
+
+    Прежний файл (previous или текущее значение поля) освобождается после
+    фиксации транзакции. Файлы вариантов общие для одинаковых исходников,
+    их удаляет команда collect_media.
+    """
+    setattr(instance, renditions_field(field_name), {})
+    if previous is None:
+        previous = getattr(instance, field_name).name
+    release_file(instance._meta.get_field(field_name).storage, previous)
+
+
+def enqueue_image(instance, field_name):
+    """Постановка сохранённого изображения в очередь обработки."""
+    name = getattr(instance, field_name).name
+    if name:
+        ImageJob.objects.create(
+            model=instance._meta.label_lower,
+            object_id=instance.pk,
+            field_name=field_name,
+            source=name,
+        )
+
+
+def enqueue_missing(batch_size=1000):
+    """Постановка в очередь изображений без вариантов и без задачи.
+
+    Нужна для файлов, загруженных в обход API или до появления очереди.
+    Возвращает количество созданных задач.
+    """
+    created = 0
+    for label, field_name in IMAGE_FIELDS:
+        queued = ImageJob.objects.filter(
+            model=label, field_name=field_name
+        ).values('object_id')
+        objects = apps.get_model(label)._default_manager.exclude(
+            **{f'{field_name}__isnull': True}
+        ).exclude(**{field_name: ''}).filter(
+            **{renditions_field(field_name): {}}
+        ).exclude(pk__in=queued).values_list('pk', field_name)
+        created += len(ImageJob.objects.bulk_create(
+            (
+                ImageJob(
+                    model=label,
+                    object_id=pk,
+                    field_name=field_name,
+                    source=name,
+                )
+                for pk, name in objects.iterator()
+            ),
+            batch_size=batch_size,
+        ))
+    return created
+
+
+def claim_jobs(limit):
+    """Захват до limit задач, в том числе зависших у упавшего обработчика.
+
+    На PostgreSQL захваченные другими обработчиками строки пропускаются
+    (SKIP LOCKED), поэтому команду можно запускать в несколько процессов.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.IMAGE_JOB_TIMEOUT)
+    with transaction.atomic():
+        jobs = list(
+            ImageJob.objects.select_for_update(skip_locked=True).filter(
+                Q(status=ImageJob.PENDING)
+                | Q(status=ImageJob.PROCESSING, started_at__lt=stale)
+            ).order_by('id')[:limit]
+        )
+        ImageJob.objects.filter(pk__in=[job.pk for job in jobs]).update(
+            status=ImageJob.PROCESSING,
+            started_at=now,
+            attempts=F('attempts') + 1,
+        )
+    for job in jobs:
+        job.attempts += 1
+    return jobs
+
+
+def run_job(job):
+    """Выполнение задачи в потоке обработчика.
+
+    Ошибка обработки возвращает задачу в очередь, пока не исчерпаны
+    IMAGE_JOB_MAX_ATTEMPTS попыток. Возвращает True при успехе.
+    """
+    try:
+        process_job(job)
+    except Exception as error:
+        ImageJob.objects.filter(pk=job.pk).update(
+            status=(
+                ImageJob.FAILED
+                if job.attempts >= settings.IMAGE_JOB_MAX_ATTEMPTS
+                else ImageJob.PENDING
+            ),
+            error=f'{type(error).__name__}: {error}',
+        )
+        return False
+    else:
+        ImageJob.objects.filter(pk=job.pk).delete()
+        return True
+    finally:
+        connections.close_all()
+
+
+def encode(image, image_format):
+    buffer = BytesIO()
+    if image_format == 'JPEG':
+        image.convert('RGB').save(
+            buffer,
+            'JPEG',
+            quality=settings.IMAGE_QUALITY,
+            optimize=True,
+            progressive=True,
+        )
+    elif image_format == 'WEBP':
+        image.save(buffer, 'WEBP', quality=settings.IMAGE_QUALITY)
+    else:
+        image.save(buffer, image_format, optimize=True)
+    return ContentFile(buffer.getvalue())
+
+
+def resized(image, size, crop=False):
+    """Уменьшенная копия: вписанная в size или обрезанная точно по size."""
+    if crop:
+        return ImageOps.fit(image, size, Image.LANCZOS)
+    image = image.copy()
+    image.thumbnail(size, Image.LANCZOS)
+    return image
+
+
+def rendition_name(digest, suffix, extension):
+    """Имя варианта по хэшу содержимого исходника.
+
+    Файлы раскладываются по каталогам из первых символов хэша, чтобы в
+    одном каталоге не копились сотни тысяч файлов.
+    """
+    return posixpath.join(
+        settings.IMAGE_RENDITIONS_DIR,
+        digest[:2],
+        f'{digest}_{suffix}.{extension}',
+    )
+
+
+def save_rendition(name, render):
+    """Сохранение варианта, если файла с таким именем ещё нет.
+
+    Имя однозначно определяется исходником и параметрами варианта, поэтому
+    повторная загрузка той же картинки не пересчитывает варианты. Если
+    такой же вариант одновременно сохранил другой поток, копия удаляется.
+    """
+    if default_storage.exists(name):
+        return name
+    saved = default_storage.save(name, render())
+    if saved != name:
+        default_storage.delete(saved)
+    return name
+
+
+def process_job(job):
+    """Пересохранение изображения без метаданных и создание вариантов.
+
+    Исходный файл поворачивается по EXIF, уменьшается до IMAGE_MAX_SIZE и
+    пересохраняется в JPEG или, при наличии прозрачности, в PNG. Варианты
+    из IMAGE_RENDITIONS и WebP-копия сохраняются в IMAGE_RENDITIONS_DIR под
+    именами из SHA-256 исходника. Если пока шла обработка изображение
+    заменили или объект удалили, результат отбрасывается.
+    """
+    model = apps.get_model(job.model)
+    storage = model._meta.get_field(job.field_name).storage
+    with storage.open(job.source) as file:
+        content = file.read()
+    digest = sha256(content).hexdigest()
+    image = Image.open(BytesIO(content))
+    image.load()
+    image = ImageOps.exif_transpose(image)
+    has_alpha = image.mode in ('RGBA', 'LA') or (
+        image.mode == 'P' and 'transparency' in image.info
+    )
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+    image_format = 'PNG' if has_alpha else 'JPEG'
+    extension = EXTENSIONS[image_format]
+
+    image = resized(image, (settings.IMAGE_MAX_SIZE,) * 2)
+    renditions = {}
+    for name, options in settings.IMAGE_RENDITIONS.items():
+        width, height = options['size']
+        crop = options['crop']
+        renditions[name] = save_rendition(
+            rendition_name(
+                digest, f'{width}x{height}{"c" if crop else ""}', extension
+            ),
+            lambda: encode(
+                resized(image, (width, height), crop), image_format
+            ),
+        )
+    renditions['webp'] = save_rendition(
+        rendition_name(digest, settings.IMAGE_MAX_SIZE, 'webp'),
+        lambda: encode(image, 'WEBP'),
+    )
+    directory, filename = posixpath.split(job.source)
+    main = storage.save(
+        posixpath.join(
+            directory, f'{posixpath.splitext(filename)[0]}.{extension}'
+        ),
+        encode(image, image_format),
+    )
+
+    fields = {
+        job.field_name: main,
+        renditions_field(job.field_name): renditions,
+    }
+    if any(field.name == 'updated_at' for field in model._meta.fields):
+        fields['updated_at'] = timezone.now()
+    with transaction.atomic():
+        updated = model._default_manager.filter(
+            pk=job.object_id, **{job.field_name: job.source}
+        ).update(**fields)
+        if updated and job.model in VERSION_KEYS:
+            bump_versions((VERSION_KEYS[job.model],))
+    storage.delete(job.source if updated else main)
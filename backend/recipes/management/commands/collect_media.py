@@ -0,0 +1,92 @@
+import posixpath
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from recipes.images import renditions_field
+from recipes.models import ImageJob
+from recipes.storage import IMAGE_FIELDS
+
+LEGACY_DIRS = ('recipes/images', 'users')
+
+
+def walk(directory):
+    """Имена всех файлов каталога хранилища и его подкаталогов."""
+    if not default_storage.exists(directory):
+        return
+    directories, files = default_storage.listdir(directory)
+    for name in files:
+        yield posixpath.join(directory, name)
+    for name in directories:
+        yield from walk(posixpath.join(directory, name))
+
+
+class Command(BaseCommand):
+    """Сборка мусора в загруженных изображениях."""
+
+    help = (
+        'Удаляет из MEDIA_ROOT изображения и их варианты, на которые не '
+        'ссылаются рецепты, пользователи и задачи обработки. Файлы моложе '
+        '--min-age не трогаются: они могут принадлежать ещё не сохранённым '
+        'объектам.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=settings.MEDIA_DELETE_GRACE_PERIOD,
+            help=(
+                'Минимальный возраст удаляемого файла в секундах, по '
+                'умолчанию MEDIA_DELETE_GRACE_PERIOD.'
+            ),
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только вывести файлы, которые были бы удалены.',
+        )
+
+    def get_referenced(self):
+        referenced = set(ImageJob.objects.values_list('source', flat=True))
+        for label, field_name in IMAGE_FIELDS:
+            rows = apps.get_model(label)._default_manager.values_list(
+                field_name, renditions_field(field_name)
+            )
+            for name, renditions in rows.iterator():
+                if name:
+                    referenced.add(name)
+                referenced.update(renditions.values())
+        return referenced
+
+    def handle(self, *args, **options):
+        if options['min_age'] < 0:
+            raise CommandError('--min-age не может быть отрицательным.')
+        threshold = timezone.now() - timedelta(seconds=options['min_age'])
+        referenced = self.get_referenced()
+        deleted = size = 0
+        for directory in (
+            settings.MEDIA_CONTENT_DIR,
+            settings.IMAGE_RENDITIONS_DIR,
+            *LEGACY_DIRS,
+        ):
+            for name in walk(directory):
+                if (
+                    name in referenced
+                    or default_storage.get_modified_time(name) > threshold
+                ):
+                    continue
+                size += default_storage.size(name)
+                deleted += 1
+                if options['dry_run']:
+                    self.stdout.write(name)
+                else:
+                    default_storage.delete(name)
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Будет удалено" if options["dry_run"] else "Удалено"} '
+            f'файлов: {deleted}, {size / 1024 ** 2:.1f} МБ.'
+        ))
@@ -0,0 +1,265 @@
+import random
+from array import array
+from io import BytesIO
+from itertools import islice
+from time import monotonic
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max
+from PIL import Image
+
+from recipes.cache import (
+    RECIPES_VERSION_KEY, SHORT_LINKS_VERSION_KEY, TAGS_VERSION_KEY,
+    USERS_VERSION_KEY, bump_versions
+)
+from recipes.counters import reconcile_counters
+from recipes.models import (
+    Favorite, Ingredient, Recipe, RecipeIngredient, ShoppingCart, Tag, User
+)
+from recipes.short_codes import encode_short_code
+from users.models import Subscription
+
+BATCH_SIZE = 5000
+DEFAULT_TAGS = (
+    ('Завтрак', 'breakfast'),
+    ('Обед', 'lunch'),
+    ('Ужин', 'dinner'),
+)
+IMAGE_COLORS = (
+    '#e0a96d', '#ddc3a5', '#201e20', '#7a9d54', '#c84b31', '#ecdbba',
+    '#2d4263', '#f2a154',
+)
+
+
+def bulk_create_ids(model, objects, batch_size):
+    """bulk_create, возвращающий id созданных объектов.
+
+    PostgreSQL возвращает id из INSERT, для остальных СУБД новые id
+    выбираются запросом; предполагается, что параллельной записи нет.
+    """
+    if connection.features.can_return_rows_from_bulk_insert:
+        model.objects.bulk_create(objects, batch_size=batch_size)
+        return [obj.pk for obj in objects]
+    max_id = model.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+    model.objects.bulk_create(objects, batch_size=batch_size)
+    return list(
+        model.objects.filter(id__gt=max_id).order_by('id').values_list(
+            'id', flat=True
+        )
+    )
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class Command(BaseCommand):
+    """Команда генерации тестовых данных для нагрузочного тестирования."""
+
+    help = (
+        'Создаёт пользователей, рецепты с тегами и ингредиентами, избранное, '
+        'списки покупок и подписки пачками bulk_create и пересчитывает '
+        'счётчики. При одинаковом seed данные повторяются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--tags-per-recipe', type=int, default=2)
+        parser.add_argument('--favorites-per-user', type=int, default=10)
+        parser.add_argument('--carts-per-user', type=int, default=5)
+        parser.add_argument('--subscriptions-per-user', type=int, default=5)
+        parser.add_argument(
+            '--images',
+            type=int,
+            default=len(IMAGE_COLORS),
+            help='Размер общего набора картинок для всех рецептов.',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--prefix',
+            default='load',
+            help='Префикс имён пользователей и рецептов.',
+        )
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument(
+            '--password',
+            default='loadtest-password',
+            help='Пароль всех созданных пользователей.',
+        )
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['images'] < 1:
+            raise CommandError('Нужен хотя бы один пользователь и картинка.')
+        ingredient_ids = list(
+            Ingredient.objects.order_by('id').values_list('id', flat=True)
+        )
+        if not ingredient_ids:
+            raise CommandError(
+                'Справочник ингредиентов пуст, выполните import_from_csv.'
+            )
+        if User.objects.filter(
+            username__startswith=f'{options["prefix"]}_'
+        ).exists():
+            raise CommandError(
+                f'Данные с префиксом {options["prefix"]} уже созданы, '
+                'укажите другой --prefix.'
+            )
+        self.rng = random.Random(options['seed'])
+        self.options = options
+        self.batch_size = options['batch_size']
+        started_at = monotonic()
+
+        tag_ids = self.get_tag_ids()
+        images = self.create_images(options['images'])
+        with transaction.atomic():
+            user_ids = self.create_users()
+            recipe_ids = self.create_recipes(
+                user_ids, tag_ids, ingredient_ids, images
+            )
+            self.create_user_links(
+                Favorite, user_ids, recipe_ids, 'recipe',
+                options['favorites_per_user'],
+            )
+            self.create_user_links(
+                ShoppingCart, user_ids, recipe_ids, 'recipe',
+                options['carts_per_user'],
+            )
+            self.create_user_links(
+                Subscription, user_ids, user_ids, 'author',
+                options['subscriptions_per_user'],
+            )
+            # bulk_create не отправляет сигналы, обновляющие счётчики.
+            reconcile_counters()
+        bump_versions(
+            (RECIPES_VERSION_KEY, SHORT_LINKS_VERSION_KEY, USERS_VERSION_KEY)
+        )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано пользователей: {len(user_ids)}, '
+            f'рецептов: {len(recipe_ids)} '
+            f'за {monotonic() - started_at:.1f} с.'
+        ))
+
+    def get_tag_ids(self):
+        """id тегов по возрастанию, чтобы при одном seed данные совпадали."""
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create(
+                Tag(name=name, slug=slug) for name, slug in DEFAULT_TAGS
+            )
+            # bulk_create не отправляет сигналы, сбрасывающие справочник.
+            bump_versions((TAGS_VERSION_KEY,))
+        return list(Tag.objects.order_by('id').values_list('id', flat=True))
+
+    def create_images(self, count):
+        """Общий набор картинок.
+
+        Хранилище изображений адресуется по содержимому, поэтому картинки
+        одного цвета хранятся одним файлом.
+        """
+        storage = Recipe._meta.get_field('image').storage
+        names = []
+        for index in range(count):
+            buffer = BytesIO()
+            Image.new(
+                'RGB', (600, 400), IMAGE_COLORS[index % len(IMAGE_COLORS)]
+            ).save(buffer, 'PNG')
+            names.append(storage.save(
+                f'{index}.png', ContentFile(buffer.getvalue())
+            ))
+        return names
+
+    def create_users(self):
+        prefix = self.options['prefix']
+        password = make_password(self.options['password'])
+        users = (
+            User(
+                username=f'{prefix}_{index}',
+                email=f'{prefix}_{index}@example.com',
+                first_name=f'Имя{index}',
+                last_name=f'Фамилия{index}',
+                password=password,
+            )
+            for index in range(self.options['users'])
+        )
+        user_ids = []
+        for batch in batches(users, self.batch_size):
+            user_ids += bulk_create_ids(User, batch, self.batch_size)
+        self.stdout.write(f'Пользователи: {len(user_ids)}')
+        return user_ids
+
+    def create_recipes(self, user_ids, tag_ids, ingredient_ids, images):
+        prefix = self.options['prefix']
+        rng = self.rng
+        tags_per_recipe = min(self.options['tags_per_recipe'], len(tag_ids))
+        ingredients_per_recipe = min(
+            self.options['ingredients_per_recipe'], len(ingredient_ids)
+        )
+        recipes = (
+            Recipe(
+                author_id=rng.choice(user_ids),
+                name=f'{prefix} рецепт {index}',
+                text=f'Описание рецепта {index}.',
+                image=rng.choice(images),
+                cooking_time=rng.randint(1, 180),
+            )
+            for index in range(self.options['recipes'])
+        )
+        recipe_ids = array('q')
+        recipe_tags = Recipe.tags.through
+        for batch in batches(recipes, self.batch_size):
+            ids = bulk_create_ids(Recipe, batch, self.batch_size)
+            recipe_ids.extend(ids)
+            Recipe.objects.bulk_update(
+                (
+                    Recipe(pk=pk, short_code=encode_short_code(pk))
+                    for pk in ids
+                ),
+                ('short_code',),
+                batch_size=self.batch_size,
+            )
+            recipe_tags.objects.bulk_create(
+                (
+                    recipe_tags(recipe_id=recipe_id, tag_id=tag_id)
+                    for recipe_id in ids
+                    for tag_id in rng.sample(tag_ids, tags_per_recipe)
+                ),
+                batch_size=self.batch_size,
+            )
+            RecipeIngredient.objects.bulk_create(
+                (
+                    RecipeIngredient(
+                        recipe_id=recipe_id,
+                        ingredient_id=ingredient_id,
+                        amount=rng.randint(1, 1000),
+                    )
+                    for recipe_id in ids
+                    for ingredient_id in rng.sample(
+                        ingredient_ids, ingredients_per_recipe
+                    )
+                ),
+                batch_size=self.batch_size,
+            )
+            self.stdout.write(f'Рецепты: {len(recipe_ids)}')
+        return recipe_ids
+
+    def create_user_links(self, model, user_ids, target_ids, field, count):
+        """Связи пользователей с count случайными объектами target_ids."""
+        rng = self.rng
+        links = (
+            model(user_id=user_id, **{f'{field}_id': target_id})
+            for user_id in user_ids
+            for target_id in rng.sample(
+                target_ids, min(count, len(target_ids))
+            )
+            if target_id != user_id or field != 'author'
+        )
+        for batch in batches(links, self.batch_size):
+            model.objects.bulk_create(batch, ignore_conflicts=True)
+        self.stdout.write(f'{model._meta.verbose_name_plural}: готово')
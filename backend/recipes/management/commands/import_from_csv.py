@@ -1,37 +1,134 @@
 import csv
-import os
+import json
+from itertools import islice
+from pathlib import Path
+from time import monotonic
 
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
 
-from django.core.management.base import BaseCommand
-
+from recipes.cache import INGREDIENTS_VERSION_KEY, bump_versions
 from recipes.models import Ingredient
-from backend.settings import BASE_DIR
 
-FILE_PATH = BASE_DIR / '/app/data/'
-FILENAME = 'ingredients.csv'
+DEFAULT_PATH = settings.BASE_DIR / 'data' / 'ingredients.csv'
+BATCH_SIZE = 1000
+READ_SIZE = 64 * 1024
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if len(row) != 2:
+            yield None
+            continue
+        yield row
+
+
+def read_json(file):
+    """Потоковое чтение JSON-массива объектов без загрузки файла целиком."""
+    decoder = json.JSONDecoder()
+    buffer = file.read(READ_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Ожидался JSON-массив.')
+    buffer = buffer[1:]
+    while True:
+        buffer = buffer.lstrip()
+        if buffer.startswith(']'):
+            return
+        if buffer.startswith(','):
+            buffer = buffer[1:]
+            continue
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            chunk = file.read(READ_SIZE)
+            if not chunk:
+                raise CommandError('Некорректный JSON-файл.')
+            buffer += chunk
+            continue
+        buffer = buffer[end:]
+        try:
+            yield item['name'], item['measurement_unit']
+        except (TypeError, KeyError):
+            yield None
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+}
 
 
 class Command(BaseCommand):
-    """Команда для импорта данных в базу из CSV-файла."""
+    """Команда для импорта ингредиентов в базу из CSV- или JSON-файла."""
 
-    help = 'Импорт данных из CSV-файла в базу данных'
+    help = (
+        'Импорт ингредиентов из CSV-файла (название,единица) или JSON-массива '
+        'объектов с полями name и measurement_unit. Уже существующие '
+        'ингредиенты пропускаются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default=str(DEFAULT_PATH),
+            help=f'Путь к файлу, по умолчанию {DEFAULT_PATH}.',
+        )
+        parser.add_argument(
+            '--format',
+            choices=tuple(READERS),
+            help='Формат файла, по умолчанию определяется по расширению.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Количество строк в одном INSERT.',
+        )
 
     def handle(self, *args, **options):
-        file = os.path.join(FILE_PATH, FILENAME)
+        path = Path(options['path'])
+        file_format = options['format'] or path.suffix.lstrip('.').lower()
+        if file_format not in READERS:
+            raise CommandError(
+                f'Не удалось определить формат файла {path}, '
+                'укажите --format.'
+            )
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size должен быть положительным.')
+
+        started_at = monotonic()
+        count_before = Ingredient.objects.count()
+        total = invalid = 0
         try:
-            with open(file, 'r', encoding='utf-8') as csv_file:
-                reader = csv.reader(csv_file)
-                for row in reader:
-                    name, unit = row
-                    Ingredient.objects.create(
-                        name=name, measurement_unit=unit
+            with open(path, encoding='utf-8', newline='') as file:
+                rows = READERS[file_format](file)
+                while batch := list(islice(rows, batch_size)):
+                    ingredients = [
+                        Ingredient(
+                            name=row[0].strip(),
+                            measurement_unit=row[1].strip(),
+                        )
+                        for row in batch
+                        if row is not None
+                    ]
+                    total += len(batch)
+                    invalid += len(batch) - len(ingredients)
+                    Ingredient.objects.bulk_create(
+                        ingredients, ignore_conflicts=True
                     )
-                self.stdout.write(
-                    self.style.SUCCESS('Данные из файла загружены в БД.')
-                )
-        except Exception as e:
-            self.stdout.write(
-                self.style.ERROR(
-                    f'Произошла ошибка при обработке файла {e}.'
-                )
-            )
+        except OSError as error:
+            raise CommandError(f'Не удалось прочитать файл {path}: {error}')
+        inserted = Ingredient.objects.count() - count_before
+        if inserted:
+            bump_versions((INGREDIENTS_VERSION_KEY,))
+
+        elapsed = monotonic() - started_at
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано строк: {total}, добавлено: {inserted}, '
+            f'пропущено: {total - invalid - inserted}, '
+            f'с ошибками: {invalid}. '
+            f'Время: {elapsed:.2f} с ({total / max(elapsed, 1e-6):.0f} '
+            'строк/с).'
+        ))
@@ -0,0 +1,77 @@
+from concurrent.futures import ThreadPoolExecutor
+from time import sleep
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.images import claim_jobs, enqueue_missing, run_job
+
+
+class Command(BaseCommand):
+    """Обработчик очереди загруженных изображений."""
+
+    help = (
+        'Пересохраняет загруженные изображения без метаданных и создаёт '
+        'их уменьшенные варианты и WebP-копии. Задачи берутся из таблицы '
+        'ImageJob и выполняются пулом потоков.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=settings.IMAGE_WORKER_THREADS,
+            help='Количество потоков обработки.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=20,
+            help='Количество задач, захватываемых за раз.',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=2,
+            help='Пауза в секундах, когда очередь пуста.',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Обработать накопившиеся задачи и завершиться.',
+        )
+        parser.add_argument(
+            '--enqueue-missing',
+            action='store_true',
+            help='Поставить в очередь изображения, у которых нет вариантов.',
+        )
+
+    def handle(self, *args, **options):
+        if options['threads'] < 1 or options['batch_size'] < 1:
+            raise CommandError(
+                '--threads и --batch-size должны быть положительными.'
+            )
+        if options['enqueue_missing']:
+            self.stdout.write(
+                f'Поставлено в очередь: {enqueue_missing()}.'
+            )
+        processed = failed = 0
+        with ThreadPoolExecutor(options['threads']) as pool:
+            while True:
+                jobs = claim_jobs(options['batch_size'])
+                if not jobs:
+                    if options['once']:
+                        break
+                    sleep(options['poll_interval'])
+                    continue
+                for job, success in zip(jobs, pool.map(run_job, jobs)):
+                    if success:
+                        processed += 1
+                    else:
+                        failed += 1
+                        self.stderr.write(
+                            f'Не удалось обработать {job.source}.'
+                        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано изображений: {processed}, с ошибками: {failed}.'
+        ))
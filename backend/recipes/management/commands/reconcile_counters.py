@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from recipes.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    """Пересчёт денормализованных счётчиков."""
+
+    help = (
+        'Пересчитывает количество добавлений рецептов в избранное и списки '
+        'покупок, рецептов и подписчиков пользователей и исправляет '
+        'разошедшиеся значения, например после bulk_create или правки '
+        'данных в обход моделей.'
+    )
+
+    def handle(self, *args, **options):
+        for counter, fixed in reconcile_counters().items():
+            self.stdout.write(f'{counter}: исправлено строк {fixed}')
+        self.stdout.write(self.style.SUCCESS('Счётчики пересчитаны.'))
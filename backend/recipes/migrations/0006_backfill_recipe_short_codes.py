@@ -0,0 +1,36 @@
+from django.db import migrations
+
+from recipes.short_codes import encode_short_code
+
+BATCH_SIZE = 1000
+
+
+def backfill_short_codes(apps, schema_editor):
+    """Коды для рецептов без кода, например созданных через bulk_create.
+
+    Существующие случайные коды сохраняются, чтобы выданные ссылки
+    продолжали работать.
+    """
+    Recipe = apps.get_model('recipes', 'Recipe')
+    recipes = [
+        Recipe(pk=pk, short_code=encode_short_code(pk))
+        for pk in Recipe.objects.filter(
+            short_code__isnull=True
+        ).values_list('id', flat=True)
+    ]
+    Recipe.objects.bulk_update(
+        recipes, ('short_code',), batch_size=BATCH_SIZE
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_recipe_pub_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            backfill_short_codes, migrations.RunPython.noop
+        ),
+    ]
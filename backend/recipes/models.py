@@ -1,11 +1,11 @@
-import random
-import string
-
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db import models
-from django.db.models import UniqueConstraint
+from django.db.models import (
+    Exists, OuterRef, Prefetch, Subquery, UniqueConstraint, Value
+)
 
+from users.models import Subscription
 from .constants import (
     MIN_VALUE,
     MAX_VALUE,
@@ -14,6 +14,8 @@ from .constants import (
     INGREDIENT_NAME_MAX_LENGTH,
     SMALL_FIELD_MAX_LENGTH
 )
+from .short_codes import encode_short_code
+from .storage import content_storage
 
 User = get_user_model()
 
@@ -55,6 +57,75 @@ class Ingredient(models.Model):
         )
 
 
+class RecipeQuerySet(models.QuerySet):
+    """Набор запросов для рецептов."""
+
+    @staticmethod
+    def related_lookups(user):
+        """Связанные данные рецептов для prefetch_related.
+
+        Автор загружается вместе с признаком подписки на него пользователя
+        user, поэтому число запросов не зависит от количества рецептов.
+        """
+        return (
+            'tags',
+            Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredient.objects.select_related('ingredient')
+            ),
+            Prefetch(
+                'author',
+                queryset=User.objects.with_subscription_flag(user)
+            ),
+        )
+
+    def with_user_flags(self, user):
+        """Добавляет признаки рецепта и его автора для пользователя user.
+
+        is_favorited и is_in_shopping_cart относятся к рецепту,
+        author_is_subscribed - к подписке на автора.
+        """
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=Value(False),
+                is_in_shopping_cart=Value(False),
+                author_is_subscribed=Value(False),
+            )
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            author_is_subscribed=Exists(Subscription.objects.filter(
+                user=user, author=OuterRef('author')
+            )),
+        )
+
+    def previews(self, limit=None):
+        """Краткие данные рецептов, не больше limit последних на автора.
+
+        Ограничение применяется коррелированным подзапросом, поэтому
+        превью для всех авторов загружаются одним запросом.
+        """
+        queryset = self.only(
+            'id',
+            'author_id',
+            'name',
+            'image',
+            'image_renditions',
+            'cooking_time',
+        ).order_by('-pub_date', '-id')
+        if limit is None:
+            return queryset
+        return queryset.filter(pk__in=Subquery(
+            Recipe.objects.filter(
+                author_id=OuterRef('author_id')
+            ).order_by('-pub_date', '-id').values('pk')[:limit]
+        ))
+
+
 class Recipe(models.Model):
     """Модель рецепта."""
 
@@ -72,7 +143,17 @@ class Recipe(models.Model):
         related_name='recipes',
     )
     name = models.CharField('Название', max_length=NAME_MAX_LENGTH)
-    image = models.ImageField('Изображение', upload_to='recipes/images/')
+    image = models.ImageField(
+        'Изображение',
+        upload_to='recipes/images/',
+        storage=content_storage,
+        db_index=True,
+    )
+    image_renditions = models.JSONField(
+        'Варианты изображения',
+        default=dict,
+        blank=True,
+    )
     cooking_time = models.PositiveSmallIntegerField(
         'Время приготовления',
         validators=(
@@ -83,6 +164,17 @@ class Recipe(models.Model):
         ),
     )
     pub_date = models.DateTimeField('Дата публикации', auto_now_add=True)
+    updated_at = models.DateTimeField('Дата изменения', auto_now=True)
+    favorites_count = models.PositiveIntegerField(
+        'В избранном',
+        default=0,
+        editable=False,
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        'В списках покупок',
+        default=0,
+        editable=False,
+    )
     tags = models.ManyToManyField(
         Tag,
         verbose_name='Теги',
@@ -96,29 +188,37 @@ class Recipe(models.Model):
         null=True
     )
 
+    objects = RecipeQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
+        indexes = (
+            models.Index(
+                fields=('-pub_date', '-id'),
+                name='recipe_pub_date_id_idx',
+            ),
+            models.Index(
+                fields=('author', '-pub_date'),
+                name='recipe_author_pub_date_idx',
+            ),
+        )
 
     def __str__(self):
         return self.name[:50]
 
     def save(self, *args, **kwargs):
-        """Переопределяем save для генерации короткого кода при создании."""
-        if not self.pk and not self.short_code:
-            self.short_code = self.generate_short_code()
-        super().save(*args, **kwargs)
-
-    def generate_short_code(self):
-        """Генерация уникального короткого кода."""
-        length = 8
-        characters = string.ascii_letters + string.digits
+        """Короткий код вычисляется из id, поэтому задаётся после вставки.
 
-        while True:
-            code = ''.join(random.choice(characters) for _ in range(length))
-            if not Recipe.objects.filter(short_code=code).exists():
-                return code
+        Код уникален по построению и не требует проверочных запросов.
+        """
+        super().save(*args, **kwargs)
+        if not self.short_code:
+            self.short_code = encode_short_code(self.pk)
+            Recipe.objects.filter(pk=self.pk).update(
+                short_code=self.short_code
+            )
 
 
 class RecipeIngredient(models.Model):
@@ -211,3 +311,47 @@ class Favorite(models.Model):
 
     def __str__(self):
         return f'{self.recipe} в избранном у  {self.user}'
+
+
+class ImageJob(models.Model):
+    """Задача фоновой обработки загруженного изображения.
+
+    Обработку выполняет команда process_images, см. recipes.images.
+    """
+
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'Ожидает'),
+        (PROCESSING, 'Обрабатывается'),
+        (FAILED, 'Ошибка'),
+    )
+
+    model = models.CharField('Модель', max_length=SMALL_FIELD_MAX_LENGTH)
+    object_id = models.PositiveBigIntegerField('id объекта')
+    field_name = models.CharField('Поле', max_length=SMALL_FIELD_MAX_LENGTH)
+    source = models.CharField('Исходный файл', max_length=NAME_MAX_LENGTH)
+    status = models.CharField(
+        'Статус',
+        max_length=SMALL_FIELD_MAX_LENGTH,
+        choices=STATUSES,
+        default=PENDING,
+    )
+    attempts = models.PositiveSmallIntegerField('Попытки', default=0)
+    error = models.TextField('Ошибка', blank=True)
+    created_at = models.DateTimeField('Создана', auto_now_add=True)
+    started_at = models.DateTimeField('Начата', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Обработка изображения'
+        verbose_name_plural = 'Обработка изображений'
+        indexes = (
+            models.Index(
+                fields=('status', 'id'),
+                name='imagejob_status_id_idx',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.source} ({self.get_status_display()})'
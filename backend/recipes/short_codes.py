@@ -0,0 +1,21 @@
+from django.conf import settings
+from hashids import Hashids
+
+from recipes.constants import SHORT_CODE_MIN_LENGTH
+
+hashids = Hashids(
+    salt=settings.HASHIDS_SALT, min_length=SHORT_CODE_MIN_LENGTH
+)
+
+
+def encode_short_code(pk):
+    """Короткий код рецепта, однозначно вычисляемый из его id."""
+    return hashids.encode(pk)
+
+
+def decode_short_code(short_code):
+    """id рецепта по короткому коду или None, если код не от hashids."""
+    decoded = hashids.decode(short_code)
+    if len(decoded) != 1:
+        return None
+    return decoded[0]
@@ -0,0 +1,140 @@
+import logging
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+from django.conf import settings
+
+from recipes.cache import SHORT_LINKS_VERSION_KEY, get_version
+from recipes.models import Recipe
+from recipes.short_codes import decode_short_code
+
+NOT_FOUND = object()
+CHECK_BATCH_SIZE = 500
+
+logger = logging.getLogger(__name__)
+
+
+class ShortLinkResolver:
+    """Кэш соответствия короткий код -> id рецепта в памяти процесса.
+
+    Хранит не больше SHORT_LINK_CACHE_SIZE кодов, вытесняя давно не
+    запрошенные. Неизвестные коды тоже кэшируются, чтобы перебор ссылок не
+    доходил до базы. Версия коротких ссылок меняется при создании и удалении
+    рецептов и проверяется не чаще раза в CATALOGUE_CHECK_INTERVAL секунд.
+    Раз в SHORT_LINK_STATS_INTERVAL секунд статистика кэша пишется в лог.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self._version = None
+        self._checked_at = None
+        self._logged_at = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def resolve(self, short_code):
+        """Пара (id рецепта или None, найден ли код в кэше)."""
+        now = monotonic()
+        self._check_version(now)
+        self._log_stats(now)
+        with self._lock:
+            pk = self._entries.get(short_code)
+            if pk is not None:
+                self._entries.move_to_end(short_code)
+                self.hits += 1
+                return (None if pk is NOT_FOUND else pk), True
+            self.misses += 1
+        pk = self._load(short_code)
+        with self._lock:
+            self._entries[short_code] = NOT_FOUND if pk is None else pk
+            while len(self._entries) > settings.SHORT_LINK_CACHE_SIZE:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return pk, False
+
+    def stats(self):
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / requests if requests else 0.0,
+            }
+
+    def _check_version(self, now):
+        if (
+            self._checked_at is not None
+            and now - self._checked_at < settings.CATALOGUE_CHECK_INTERVAL
+        ):
+            return
+        version = get_version(SHORT_LINKS_VERSION_KEY)
+        if version != self._version:
+            self._evict_stale()
+            self._version = version
+        self._checked_at = now
+
+    def _evict_stale(self):
+        """Вытеснение записей, которые могли устареть со сменой версии.
+
+        Неизвестный код мог получить новый рецепт, а известный - остаться
+        от удалённого. Существование рецептов проверяется запросами pk__in
+        по CHECK_BATCH_SIZE id, остальные записи сохраняются.
+        """
+        with self._lock:
+            for short_code in [
+                short_code
+                for short_code, pk in self._entries.items()
+                if pk is NOT_FOUND
+            ]:
+                del self._entries[short_code]
+            pks = list(set(self._entries.values()))
+        deleted = set(pks)
+        for start in range(0, len(pks), CHECK_BATCH_SIZE):
+            deleted.difference_update(Recipe.objects.filter(
+                pk__in=pks[start:start + CHECK_BATCH_SIZE]
+            ).values_list('id', flat=True))
+        if not deleted:
+            return
+        with self._lock:
+            for short_code in [
+                short_code
+                for short_code, pk in self._entries.items()
+                if pk in deleted
+            ]:
+                del self._entries[short_code]
+
+    def _log_stats(self, now):
+        if self._logged_at is None:
+            self._logged_at = now
+        if now - self._logged_at < settings.SHORT_LINK_STATS_INTERVAL:
+            return
+        self._logged_at = now
+        logger.info(
+            'Кэш коротких ссылок: кодов %(size)d, попаданий %(hits)d, '
+            'промахов %(misses)d, вытеснено %(evictions)d, '
+            'доля попаданий %(hit_rate).2f',
+            self.stats(),
+        )
+
+    @staticmethod
+    def _load(short_code):
+        """id рецепта из базы: по первичному ключу, если код от hashids.
+
+        Коды, выданные до перехода на hashids, ищутся по полю short_code.
+        """
+        pk = decode_short_code(short_code)
+        if pk is not None and Recipe.objects.filter(
+            pk=pk, short_code=short_code
+        ).exists():
+            return pk
+        return Recipe.objects.filter(short_code=short_code).values_list(
+            'id', flat=True
+        ).first()
+
+
+short_link_resolver = ShortLinkResolver()
@@ -0,0 +1,98 @@
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_save
+)
+from django.dispatch import receiver
+
+from recipes.cache import (
+    FAVORITES_VERSION_KEY, INGREDIENTS_VERSION_KEY, RECIPES_VERSION_KEY,
+    SHORT_LINKS_VERSION_KEY, TAGS_VERSION_KEY, bump_shopping_cart_versions,
+    bump_versions, invalidate_recipe_shopping_carts
+)
+from recipes.counters import change_counter, shift_counter
+from recipes.images import release_file
+from recipes.models import (
+    Favorite, Ingredient, Recipe, ShoppingCart, Tag, User
+)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, created, **kwargs):
+    if created:
+        bump_versions((RECIPES_VERSION_KEY, SHORT_LINKS_VERSION_KEY))
+    else:
+        bump_versions((RECIPES_VERSION_KEY,))
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    bump_versions((RECIPES_VERSION_KEY, SHORT_LINKS_VERSION_KEY))
+    release_file(instance.image.storage, instance.image.name)
+
+
+@receiver(pre_save, sender=Recipe)
+def recipe_author_saving(sender, instance, update_fields=None, **kwargs):
+    """Запоминает сохранённого в базе автора изменяемого рецепта."""
+    instance._saved_author_id = None
+    if instance._state.adding or (
+        update_fields is not None
+        and not {'author', 'author_id'} & set(update_fields)
+    ):
+        return
+    instance._saved_author_id = Recipe.objects.filter(
+        pk=instance.pk
+    ).values_list('author_id', flat=True).first()
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def author_recipes_changed(sender, instance, signal, created=False, **kwargs):
+    saved_author_id = getattr(instance, '_saved_author_id', None)
+    if signal is post_save and saved_author_id not in (
+        None, instance.author_id
+    ):
+        # Рецепт передали другому автору, например в админке.
+        shift_counter(User, saved_author_id, 'recipes_count', -1)
+        shift_counter(User, instance.author_id, 'recipes_count', 1)
+        return
+    change_counter(
+        User, instance.author_id, 'recipes_count', signal, created
+    )
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_versions((RECIPES_VERSION_KEY,))
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+def favorite_changed(sender, instance, signal, created=False, **kwargs):
+    bump_versions((FAVORITES_VERSION_KEY.format(instance.user_id),))
+    change_counter(
+        Recipe, instance.recipe_id, 'favorites_count', signal, created
+    )
+
+
+@receiver((post_save, post_delete), sender=ShoppingCart)
+def shopping_cart_changed(sender, instance, signal, created=False, **kwargs):
+    bump_shopping_cart_versions((instance.user_id,))
+    change_counter(
+        Recipe, instance.recipe_id, 'shopping_cart_count', signal, created
+    )
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_changed(sender, instance, created, **kwargs):
+    if not created:
+        invalidate_recipe_shopping_carts(
+            instance.recipe_ingredients.values('recipe_id')
+        )
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredient_catalogue_changed(sender, **kwargs):
+    bump_versions((INGREDIENTS_VERSION_KEY,))
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tag_catalogue_changed(sender, **kwargs):
+    bump_versions((TAGS_VERSION_KEY,))
@@ -0,0 +1,77 @@
+import os
+import posixpath
+from hashlib import sha256
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+
+IMAGE_FIELDS = (
+    ('recipes.recipe', 'image'),
+    ('users.user', 'avatar'),
+)
+
+
+def count_references(name):
+    """Количество объектов, поля IMAGE_FIELDS которых ссылаются на файл."""
+    return sum(
+        apps.get_model(label)._default_manager.filter(
+            **{field_name: name}
+        ).count()
+        for label, field_name in IMAGE_FIELDS
+    )
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, в котором имя файла - SHA-256 его содержимого.
+
+    Каталог из upload_to не учитывается, поэтому одинаковые изображения
+    рецептов и аватаров хранятся в MEDIA_CONTENT_DIR один раз. Содержимое
+    файла по имени не меняется, и его можно кэшировать бессрочно. Файл
+    удаляется, только когда на него не ссылается ни одно поле IMAGE_FIELDS.
+    """
+
+    def content_name(self, digest, extension):
+        return posixpath.join(
+            settings.MEDIA_CONTENT_DIR,
+            digest[:2],
+            digest[2:4],
+            f'{digest}{extension}',
+        )
+
+    def _save(self, name, content):
+        digest = sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        name = self.content_name(
+            digest.hexdigest(), posixpath.splitext(name)[1].lower()
+        )
+        if self.exists(name):
+            # Сдвиг времени изменения защищает файл от collect_media, пока
+            # ссылающийся на него объект ещё не сохранён.
+            os.utime(self.path(name))
+            return name
+        saved = super()._save(name, content)
+        if saved != name:
+            # Такой же файл одновременно сохранили в другом потоке.
+            super().delete(saved)
+        return name
+
+    def delete(self, name):
+        """Удаление файла, на который больше не ссылаются объекты.
+
+        Файл моложе MEDIA_DELETE_GRACE_PERIOD не удаляется: такое же
+        изображение мог только что загрузить другой запрос, ещё не
+        сохранивший свой объект. Такие файлы позже удаляет collect_media.
+        """
+        if not name or count_references(name) or not self.exists(name):
+            return
+        age = timezone.now() - self.get_modified_time(name)
+        if age.total_seconds() >= settings.MEDIA_DELETE_GRACE_PERIOD:
+            super().delete(name)
+
+
+content_storage = ContentAddressedStorage()
@@ -0,0 +1,20 @@
+# Generated by Django 3.2.3 on 2026-10-17 06:46
+
+from django.db import migrations, models
+import recipes.storage
+import users.utils
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_user_avatar_renditions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='avatar',
+            field=models.ImageField(blank=True, db_index=True, null=True, storage=recipes.storage.ContentAddressedStorage(), upload_to=users.utils.generate_avatar_path, verbose_name='Аватар'),
+        ),
+    ]
@@ -1,12 +1,29 @@
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager
 from django.db import models
-from django.db.models import UniqueConstraint
+from django.db.models import Exists, OuterRef, UniqueConstraint, Value
 
 from users.utils import generate_avatar_path
 from recipes.constants import (
     USERNAME_LENGTH,
     MAX_USERNAME
 )
+from recipes.storage import content_storage
+
+
+class UserQuerySet(models.QuerySet):
+    """Набор запросов для пользователей."""
+
+    def with_subscription_flag(self, user):
+        """Добавляет признак is_subscribed подписки user на пользователей."""
+        if not user.is_authenticated:
+            return self.annotate(is_subscribed=Value(False))
+        return self.annotate(is_subscribed=Exists(
+            Subscription.objects.filter(user=user, author=OuterRef('pk'))
+        ))
+
+
+class CustomUserManager(UserManager.from_queryset(UserQuerySet)):
+    """Менеджер пользователей с методами UserQuerySet."""
 
 
 class User(AbstractUser):
@@ -27,9 +44,29 @@ class User(AbstractUser):
     avatar = models.ImageField(
         'Аватар',
         upload_to=generate_avatar_path,
+        storage=content_storage,
         null=True,
         blank=True,
+        db_index=True,
     )
+    avatar_renditions = models.JSONField(
+        'Варианты аватара',
+        default=dict,
+        blank=True,
+    )
+    recipes_count = models.PositiveIntegerField(
+        'Количество рецептов',
+        default=0,
+        editable=False,
+    )
+    followers_count = models.PositiveIntegerField(
+        'Количество подписчиков',
+        default=0,
+        editable=False,
+    )
+
+    objects = CustomUserManager()
+
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = (
         'username',
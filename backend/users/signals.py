@@ -0,0 +1,29 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.cache import (
+    SUBSCRIPTIONS_VERSION_KEY, USERS_VERSION_KEY, bump_versions
+)
+from recipes.counters import change_counter
+from recipes.images import release_file
+from users.models import Subscription, User
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, update_fields, **kwargs):
+    if update_fields is None or set(update_fields) != {'last_login'}:
+        bump_versions((USERS_VERSION_KEY,))
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    bump_versions((USERS_VERSION_KEY,))
+    release_file(instance.avatar.storage, instance.avatar.name)
+
+
+@receiver((post_save, post_delete), sender=Subscription)
+def subscription_changed(sender, instance, signal, created=False, **kwargs):
+    bump_versions((SUBSCRIPTIONS_VERSION_KEY.format(instance.user_id),))
+    change_counter(
+        User, instance.author_id, 'followers_count', signal, created
+    )